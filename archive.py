@@ -0,0 +1,108 @@
+# archive.py
+"""
+Перенос завершённых матчей (RESOLVED/CANCELED) старше ARCHIVE_AFTER_DAYS вместе со ставками
+и подарками ставок в *_archive. Горячие таблицы, которые читают бои, пулы и резолвер,
+остаются маленькими и вместе с индексами помещаются в кэш страниц.
+
+    python archive.py                    — перенести всё, что старше порога
+    python archive.py --days 7 --max-batches 10
+
+Каждая пачка — одна транзакция: INSERT ... SELECT в архив и DELETE из горячих таблиц.
+Число перенесённых и удалённых строк сверяется; расхождение — откат пачки.
+Проводки журнала и user_stats не трогаются: балансы и статистика от переноса не меняются.
+"""
+import argparse
+from datetime import datetime, timedelta
+from typing import List
+from dotenv import load_dotenv
+load_dotenv()  # до импорта модулей проекта: они читают конфиг при импорте
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import Session
+from models import (
+    Match, Bet, BetGift, MatchArchive, BetArchive, BetGiftArchive, MatchStatus, SessionLocal
+)
+from config import get_config
+
+SETTLED = (MatchStatus.RESOLVED, MatchStatus.CANCELED)
+
+
+def _copy(s: Session, src, dst, where) -> int:
+    # колонки берём из архивной таблицы: устаревшие колонки горячей (bets.gifts_blob) не переносим
+    cols = [c.name for c in dst.__table__.columns]
+    src_t = src.__table__
+    res = s.execute(insert(dst).from_select(cols, select(*[src_t.c[n] for n in cols]).where(where)))
+    return res.rowcount
+
+
+def archive_batch(s: Session, cutoff: datetime, limit: int) -> int:
+    """
+    Переносит до limit матчей, созданных раньше cutoff, одной транзакцией. Возвращает число матчей.
+    """
+    ids: List[int] = s.scalars(
+        select(Match.id)
+        .where(Match.status.in_(SETTLED), Match.created_at < cutoff)
+        .limit(limit)
+    ).all()
+    if not ids:
+        return 0
+    bet_ids = select(Bet.id).where(Bet.match_id.in_(ids)).scalar_subquery()
+    copied = (
+        _copy(s, Match, MatchArchive, Match.id.in_(ids)),
+        _copy(s, Bet, BetArchive, Bet.match_id.in_(ids)),
+        _copy(s, BetGift, BetGiftArchive, BetGift.bet_id.in_(bet_ids)),
+    )
+    deleted = (
+        # подарки и ставки удаляем явно: на SQLite ON DELETE CASCADE работает только с PRAGMA foreign_keys
+        s.execute(delete(BetGift).where(BetGift.bet_id.in_(bet_ids))).rowcount,
+        s.execute(delete(Bet).where(Bet.match_id.in_(ids))).rowcount,
+        s.execute(delete(Match).where(Match.id.in_(ids), Match.status.in_(SETTLED))).rowcount,
+    )
+    if copied != deleted[::-1] or copied[0] != len(ids):
+        s.rollback()
+        raise RuntimeError(f"archive: скопировано {copied}, удалено {deleted[::-1]} — пачка откачена")
+    s.commit()
+    return len(ids)
+
+
+def archive_old(s: Session, older_than: timedelta | None = None, batch_size: int | None = None,
+                max_batches: int | None = None, progress=None) -> int:
+    """
+    Переносит пачками всё, что старше older_than (по умолчанию ARCHIVE_AFTER_DAYS).
+    Возвращает общее число перенесённых матчей.
+    """
+    cfg = get_config()
+    if older_than is None:
+        older_than = timedelta(days=cfg.ARCHIVE_AFTER_DAYS)
+    cutoff = datetime.utcnow() - older_than
+    batch_size = batch_size or cfg.ARCHIVE_BATCH_SIZE
+    total = batches = 0
+    while max_batches is None or batches < max_batches:
+        moved = archive_batch(s, cutoff, batch_size)
+        total += moved
+        batches += 1
+        if progress and moved:
+            progress(total)
+        if moved < batch_size:
+            break
+    return total
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--days", type=float, default=None, help="старше скольких дней (по умолчанию ARCHIVE_AFTER_DAYS)")
+    p.add_argument("--batch", type=int, default=None, help="матчей в транзакции (по умолчанию ARCHIVE_BATCH_SIZE)")
+    p.add_argument("--max-batches", type=int, default=None)
+    args = p.parse_args(argv)
+    s = SessionLocal()
+    try:
+        total = archive_old(
+            s, timedelta(days=args.days) if args.days is not None else None, args.batch, args.max_batches,
+            progress=lambda n: print(f"матчей перенесено: {n}", flush=True),
+        )
+    finally:
+        s.close()
+    print(f"готово: {total}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# bench.py
+"""
+Нагрузочный прогон боёв и баланса на временной SQLite-базе, без сети Telegram.
+
+    python bench.py --users 50 --requests 20 --out run.json
+    python bench.py --users 50 --requests 20 --compare run.json
+
+Сценарии: web_fight (/api/start_fight), web_me (/api/me) — через Flask test client в потоках;
+bot_fight (/fight), bot_balance (/balance) — вызовом хэндлеров с поддельными Update/Context.
+На сценарий: запросы/с, p50/p95/p99 задержки, SQL-запросов и коммитов на запрос (JSON).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+SCENARIOS = ("web_fight", "web_me", "bot_fight", "bot_balance")
+BASE_TG_ID = 10_000_000
+
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+class SqlCounter:
+    def __init__(self, *engines):
+        from sqlalchemy import event
+        self._lock = threading.Lock()
+        self.statements = 0
+        self.commits = 0
+        for engine in set(engines):
+            event.listen(engine, "before_cursor_execute", self._on_execute)
+            event.listen(engine, "commit", self._on_commit)
+
+    def _on_execute(self, *args):
+        with self._lock:
+            self.statements += 1
+
+    def _on_commit(self, conn):
+        with self._lock:
+            self.commits += 1
+
+    def snapshot(self):
+        return self.statements, self.commits
+
+
+class FakeSender:
+    # вместо bot.send_message: ответы из outbox копятся по чатам
+    def __init__(self):
+        self.replies = {}
+
+    async def __call__(self, chat_id, text):
+        self.replies.setdefault(chat_id, []).append(text)
+
+
+def fake_update(tg_id: int):
+    user = SimpleNamespace(id=tg_id, username=f"bench{tg_id}")
+    return SimpleNamespace(effective_user=user, effective_chat=SimpleNamespace(id=tg_id))
+
+
+def summarize(name, latencies, errors, elapsed, counter_before, counter_after) -> dict:
+    n = len(latencies)
+    lat = sorted(latencies)
+    statements = counter_after[0] - counter_before[0]
+    commits = counter_after[1] - counter_before[1]
+    return {
+        "scenario": name,
+        "requests": n,
+        "errors": errors,
+        "rps": round(n / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(lat, 50) * 1000, 2),
+        "p95_ms": round(percentile(lat, 95) * 1000, 2),
+        "p99_ms": round(percentile(lat, 99) * 1000, 2),
+        "sql_per_req": round(statements / n, 2) if n else 0.0,
+        "commits_per_req": round(commits / n, 2) if n else 0.0,
+    }
+
+
+def run_web(web, bot, counter, name, users, requests):
+    path = "/api/start_fight" if name == "web_fight" else "/api/me"
+    payload = {"currency": "stars", "bet": {"amount": 10}} if name == "web_fight" else {}
+
+    def worker(i):
+        client = web.app.test_client()
+        out, errors = [], 0
+        for _ in range(requests):
+            t0 = time.perf_counter()
+            resp = client.post(path, json={"initData": str(BASE_TG_ID + i), "payload": payload})
+            out.append(time.perf_counter() - t0)
+            if resp.status_code >= 400 or (resp.is_json and not resp.json.get("ok")):
+                errors += 1
+        return out, errors
+
+    before = counter.snapshot()
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=users) as pool:
+        results = list(pool.map(worker, range(users)))
+    elapsed = time.perf_counter() - t0
+    latencies = [x for r, _ in results for x in r]
+    return summarize(name, latencies, sum(e for _, e in results), elapsed, before, counter.snapshot())
+
+
+def run_bot(web, bot, counter, name, users, requests):
+    handler = bot.cmd_fight if name == "bot_fight" else bot.cmd_balance
+    sender = bot.outbox.sender = FakeSender()
+
+    async def user_loop(i):
+        out, errors = [], 0
+        for _ in range(requests):
+            update = fake_update(BASE_TG_ID + i)
+            t0 = time.perf_counter()
+            try:
+                await handler(update, SimpleNamespace(args=[], bot=None))
+            except Exception:
+                errors += 1
+            out.append(time.perf_counter() - t0)
+        return out, errors
+
+    async def main():
+        results = await asyncio.gather(*(user_loop(i) for i in range(users)))
+        elapsed = time.perf_counter() - t0
+        # хэндлеры только ставят ответы в очередь; дожидаемся отправки, чтобы посчитать ошибки
+        await bot.outbox.drain()
+        return results, elapsed
+
+    before = counter.snapshot()
+    t0 = time.perf_counter()
+    results, elapsed = asyncio.run(main())
+    latencies = [x for r, _ in results for x in r]
+    errors = sum(e for _, e in results)
+    errors += sum(text.count("Ошибка") for texts in sender.replies.values() for text in texts)
+    return summarize(name, latencies, errors, elapsed, before, counter.snapshot())
+
+
+def compare(current: dict, previous: dict):
+    print(f"{'scenario':<12} {'metric':<16} {'before':>10} {'after':>10} {'change':>8}")
+    for name, cur in current["scenarios"].items():
+        prev = previous.get("scenarios", {}).get(name)
+        if not prev:
+            continue
+        for metric in ("rps", "p50_ms", "p95_ms", "p99_ms", "sql_per_req", "commits_per_req"):
+            a, b = prev[metric], cur[metric]
+            change = f"{(b - a) / a * 100:+.0f}%" if a else "—"
+            print(f"{name:<12} {metric:<16} {a:>10} {b:>10} {change:>8}")
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--users", type=int, default=20, help="одновременных пользователей")
+    p.add_argument("--requests", type=int, default=10, help="запросов на пользователя")
+    p.add_argument("--scenarios", default=",".join(SCENARIOS))
+    p.add_argument("--match-wait", type=float, default=0.05, help="MATCH_WAIT_SECONDS для прогона")
+    p.add_argument("--rate-limits", default="", help="RATE_LIMITS для прогона (по умолчанию без лимитов)")
+    p.add_argument("--db", help="путь к SQLite (по умолчанию временный файл)")
+    p.add_argument("--out", help="куда записать JSON с результатами")
+    p.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    args = p.parse_args(argv)
+
+    tmpdir = tempfile.mkdtemp(prefix="pvp-bench-")
+    db_path = args.db or os.path.join(tmpdir, "bench.sqlite3")
+    # конфиг читается при импорте модулей — выставляем окружение до импорта web и bot
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["MATCH_WAIT_SECONDS"] = str(args.match_wait)
+    os.environ["RATE_LIMITS"] = args.rate_limits
+    os.environ["RATE_LIMIT_DB_URL"] = f"sqlite:///{os.path.join(tmpdir, 'ratelimit.sqlite3')}"
+
+    import web
+    import bot
+    from models import engine, read_engine, init_db, SessionLocal
+    from logic import get_or_create_user
+    from ledger import post_entries
+    from catalog import gift_catalog
+
+    init_db()
+    gift_catalog.load()
+    # в мини-приложении пользователь пока не извлекается из initData — в прогоне берём tg_id оттуда
+    web.resolve_tg_user_from_webapp = lambda init_data: int(init_data)
+
+    s = SessionLocal()
+    try:
+        ids = [get_or_create_user(s, BASE_TG_ID + i).id for i in range(args.users)]
+        post_entries(s, [{"user_id": uid, "delta": 10 * args.requests * len(SCENARIOS), "reason": "grant"}
+                         for uid in ids])
+        s.commit()
+    finally:
+        s.close()
+
+    counter = SqlCounter(engine, read_engine)
+    result = {
+        "config": {"users": args.users, "requests": args.requests, "match_wait": args.match_wait,
+                   "python": sys.version.split()[0]},
+        "scenarios": {},
+    }
+    for name in args.scenarios.split(","):
+        name = name.strip()
+        if name not in SCENARIOS:
+            p.error(f"неизвестный сценарий {name}")
+        runner = run_web if name.startswith("web_") else run_bot
+        result["scenarios"][name] = runner(web, bot, counter, name, args.users, args.requests)
+        print(json.dumps(result["scenarios"][name], ensure_ascii=False))
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(result, json.load(f))
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+# bot.py
+"""
+Telegram-бот: команды, long polling или вебхук (BOT_MODE). Flask здесь не импортируется.
+Отдельный процесс: python bot.py; вместе с веб-частью для разработки — python app.py.
+"""
+import asyncio
+import os
+import signal
+from datetime import datetime
+from dotenv import load_dotenv
+load_dotenv()  # до импорта модулей проекта: они читают конфиг при импорте
+from sqlalchemy.orm import Session
+from models import engine, read_engine, init_db, User, Currency
+from logic import get_or_create_user, inventory_delta, check_stake, set_gift_price, enter_pool
+from ratelimit import rate_limiter
+from user_state import state_cache, load_user_state, get_user_state
+from ledger import ledger_writer, balance_of
+from matchmaking import Ticket, matchmaker, wait_result_async, fight_bot_fallback
+from catalog import gift_catalog
+from db_executor import run_db, run_read
+from outbox import outbox, PRIORITY_NOTIFY
+from resolver import resolver
+from stats import METRICS, leaderboard
+from history import history_by_tg
+from grants import bulk_grant, summary_text
+from metrics import instrument_engine, instrumented_command
+from config import get_config
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler, ContextTypes
+
+cfg = get_config()
+instrument_engine(engine)
+instrument_engine(read_engine)
+
+BOT_TOKEN = os.getenv("BOT_TOKEN", "")
+
+def reply(update: Update, text: str):
+    # ответ уходит через outbox с учётом лимитов Telegram; хэндлер не ждёт отправки
+    outbox.enqueue(update.effective_chat.id, text)
+
+# Синхронная часть команд: выполняется в пуле потоков через run_db и возвращает готовый текст.
+
+def _ensure_user(s: Session, tg_id: int, username: str | None):
+    get_or_create_user(s, tg_id, username)
+
+def _balance_text(state: dict) -> str:
+    gifts_str = ", ".join([f"{g['title']} x{g['qty']}" for g in state["gifts"]]) or "нет"
+    return f"⭐️ Звёзды: {state['stars']}\n🎁 Подарки: {gifts_str}"
+
+def _addstars_text(s: Session, tg_id: int, username: str | None, amount: int) -> str:
+    u = get_or_create_user(s, tg_id, username)
+    # одиночное начисление — через групповой коммит журнала, а не отдельной транзакцией
+    ledger_writer.submit(u.id, amount, "grant").result()
+    return f"Начислено {amount}⭐️. Текущий баланс: {balance_of(s, u.id)}"
+
+def _gifts_text(state: dict) -> str:
+    gifts_str = "\n".join([f"{g['title']} ({g['code']}) x{g['qty']} (⭐️{g['value']})" for g in state["gifts"]])
+    return "Ваши подарки:\n" + gifts_str
+
+def _grant_test_gifts(s: Session, tg_id: int, username: str | None) -> str:
+    state = get_user_state(s, tg_id, username)
+    if state["gifts"]:
+        return _gifts_text(state)
+    inventory_delta(s, s.get(User, state["user_id"]), "ROSE", +3)
+    return "Подарков нет. Для теста выдам ROSE x3."
+
+async def _read_state(tg_id: int, username: str | None) -> dict:
+    # кэш -> сессия чтения -> основная БД (только для нового пользователя)
+    return (
+        state_cache.get(tg_id)
+        or await run_read(load_user_state, tg_id, username, create=False)
+        or await run_db(load_user_state, tg_id, username)
+    )
+
+def _enqueue_fight(s: Session, tg_id: int, username: str | None, amount: int) -> Ticket | str:
+    user = get_or_create_user(s, tg_id, username)
+    ok, msg, value = check_stake(s, user, Currency.STARS, amount)
+    if not ok:
+        return "Ошибка: " + msg
+    ticket = Ticket(user.id, Currency.STARS, amount, value)
+    if not matchmaker.submit(ticket):
+        return "Вы уже ищете соперника."
+    return ticket
+
+def _fight_text(ticket: Ticket, result) -> str:
+    ok, msg, res = result
+    if not ok:
+        return "Ошибка: " + msg
+    opponent_amount = next(v for uid, v in res["stakes"].items() if uid != ticket.user_id)
+    detail = res["detail"]
+    text = f"Матч #{res['match_id']}: вы поставили {ticket.stake}⭐️, соперник — {opponent_amount}⭐️.\nПул: {res['pool']}⭐️, комиссия: {res['commission']}⭐️."
+    if detail.get("type") == "gift":
+        text += f" Комиссия подарком {detail['gift_code']} (⭐️{detail['gift_value']})."
+    text += "\nИтог: " + ("🎉 Победа!" if res["winner_user_id"] == ticket.user_id else "Поражение 😔")
+    return text
+
+def _join_pool(s: Session, tg_id: int, username: str | None, amount: int) -> tuple:
+    user = get_or_create_user(s, tg_id, username)
+    ok, msg, pool = enter_pool(s, Currency.STARS, user, amount)
+    if not ok:
+        return "Ошибка: " + msg, None, None
+    seconds = max(0, int((pool["lock_at"] - datetime.utcnow()).total_seconds()))
+    return f"{msg} Пул #{pool['match_id']}, розыгрыш через {seconds} с.", pool["match_id"], user.id
+
+def _pool_text(match_id: int, user_id: int, res: dict) -> str:
+    if res.get("canceled"):
+        return f"Пул #{match_id} отменён: не набралось участников. Ставка возвращена."
+    text = f"Пул #{match_id} разыгран. Пул: {res['pool']}⭐️, комиссия: {res['commission']}⭐️.\nИтог: "
+    return text + ("🎉 Победа!" if res["winner_user_id"] == user_id else "Поражение 😔")
+
+async def _notify_pool(chat_id: int, match_id: int, user_id: int):
+    # итог пула приходит отдельным сообщением, когда резолвер его разыграет
+    try:
+        res = await asyncio.wait_for(asyncio.wrap_future(resolver.submit(match_id)),
+                                     timeout=cfg.POOL_LOCK_SECONDS + 60)
+    except asyncio.TimeoutError:
+        resolver.discard(match_id)
+        return
+    outbox.enqueue(chat_id, _pool_text(match_id, user_id, res), PRIORITY_NOTIFY)
+
+_METRIC_TITLES = {"wins": "победам", "volume": "сумме ставок", "net": "выигрышу"}
+
+def _top_text(metric: str, top: list) -> str:
+    if not top:
+        return "Рейтинг пока пуст."
+    lines = [f"Топ по {_METRIC_TITLES[metric]}:"]
+    lines += [f"{i}. {row['name']} — {row['value']}" for i, row in enumerate(top, 1)]
+    return "\n".join(lines)
+
+_OUTCOMES = {"win": "🎉 победа", "loss": "поражение", "pending": "ждёт розыгрыша", "canceled": "отменён"}
+
+def _history_text(items: list, next_cursor: str | None) -> str:
+    if not items:
+        return "Матчей пока нет."
+    lines = [
+        f"#{it['match_id']} {it['created_at']:%d.%m %H:%M} — ставка {it['stake']}⭐️ из {it['pool']}⭐️, "
+        f"{_OUTCOMES[it['outcome']]}"
+        for it in items
+    ]
+    if next_cursor:
+        lines.append(f"Дальше: /history {next_cursor}")
+    return "\n".join(lines)
+
+async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await run_db(_ensure_user, update.effective_user.id, update.effective_user.username)
+    reply(
+        update,
+        "Привет! Это PvP-бот.\n"
+        "Команды:\n"
+        "/balance — баланс\n"
+        "/fight — быстрый бой с ботом\n"
+        "/pool 10 — ставка в общий пул\n"
+        "/top wins|volume|net — рейтинг игроков\n"
+        "/history — мои матчи\n"
+        "/addstars 50 — выдать себе звезды (для теста)\n"
+        "/gifts — мои подарки\n"
+        "/mini — открыть мини-приложение"
+    )
+
+async def cmd_balance(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    state = await _read_state(update.effective_user.id, update.effective_user.username)
+    reply(update, _balance_text(state))
+
+async def cmd_addstars(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not context.args:
+        reply(update, "Укажите кол-во: /addstars 50")
+        return
+    amount = int(context.args[0])
+    text = await run_db(_addstars_text, update.effective_user.id, update.effective_user.username, amount)
+    reply(update, text)
+
+async def cmd_gifts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    state = await _read_state(update.effective_user.id, update.effective_user.username)
+    if state["gifts"]:
+        text = _gifts_text(state)
+    else:
+        text = await run_db(_grant_test_gifts, update.effective_user.id, update.effective_user.username)
+    reply(update, text)
+
+async def cmd_fight(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Быстрый бой: игрок ставит 10⭐️ и ждёт живого соперника через matchmaker;
+    не нашёлся за MATCH_WAIT_SECONDS — бот, случайно 8-12⭐️.
+    """
+    if not await rate_limiter.allow_async("fight", update.effective_user.id):
+        reply(update, "Слишком часто. Подождите несколько секунд.")
+        return
+    ticket = await run_db(_enqueue_fight, update.effective_user.id, update.effective_user.username, 10)
+    if isinstance(ticket, str):
+        reply(update, ticket)
+        return
+    result = await wait_result_async(matchmaker, ticket)
+    if result is None:
+        result = await run_db(fight_bot_fallback, ticket)
+    reply(update, _fight_text(ticket, result))
+
+async def cmd_pool(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Ставка звёздами в текущий общий пул; итог придёт, когда пул закроется и будет разыгран.
+    """
+    amount = int(context.args[0]) if context.args else 10
+    text, match_id, user_id = await run_db(
+        _join_pool, update.effective_user.id, update.effective_user.username, amount
+    )
+    reply(update, text)
+    if match_id is not None:
+        asyncio.get_running_loop().create_task(_notify_pool(update.effective_chat.id, match_id, user_id))
+
+async def cmd_top(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    metric = context.args[0].lower() if context.args else "wins"
+    if metric not in METRICS:
+        reply(update, "Формат: /top wins, /top volume или /top net")
+        return
+    top = await run_read(leaderboard.top, metric, 10)
+    reply(update, _top_text(metric, top))
+
+async def cmd_history(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    cursor = context.args[0] if context.args else None
+    try:
+        items, next_cursor = await run_read(history_by_tg, update.effective_user.id, 10, cursor)
+    except ValueError:
+        reply(update, "Неверный курсор. Начните сначала: /history")
+        return
+    reply(update, _history_text(items, next_cursor))
+
+async def cmd_setprice(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id != cfg.ADMIN_USER_ID:
+        return
+    if len(context.args) != 2:
+        reply(update, "Формат: /setprice ROSE 5")
+        return
+    code, value = context.args[0].upper(), int(context.args[1])
+    if not await run_db(set_gift_price, code, value):
+        reply(update, f"Не удалось изменить цену {code}.")
+        return
+    reply(update, f"Цена {code} теперь ⭐️{value}.")
+
+async def cmd_grant(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Массовое начисление (grants.py): ответом на CSV-документ или строками tg_id,stars[,CODE:qty...] после команды.
+    """
+    if update.effective_user.id != cfg.ADMIN_USER_ID:
+        return
+    replied = update.message.reply_to_message
+    if replied and replied.document:
+        file = await context.bot.get_file(replied.document.file_id)
+        lines = bytes(await file.download_as_bytearray()).decode("utf-8-sig").splitlines()
+    else:
+        parts = update.message.text.split(maxsplit=1)
+        lines = parts[1].splitlines() if len(parts) > 1 else []
+    if not lines:
+        reply(update, "Ответьте /grant на CSV-файл или: /grant 123456,50,ROSE:2")
+        return
+    chat_id = update.effective_chat.id
+    loop = asyncio.get_running_loop()
+
+    def progress(total: dict):
+        # вызывается из пула потоков БД; outbox живёт в event loop бота
+        loop.call_soon_threadsafe(outbox.enqueue, chat_id, f"Начислено строк: {total['rows']}", PRIORITY_NOTIFY)
+
+    total = await run_db(bulk_grant, lines, 5000, "promo", progress)
+    reply(update, "Готово. " + summary_text(total))
+
+async def cmd_mini(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    url = os.getenv("WEBAPP_URL", "http://localhost:5000")
+    reply(update, f"Открыть мини-приложение: {url}")
+
+async def _start_outbox(app_: Application):
+    outbox.sender = app_.bot.send_message
+
+async def _drain_outbox(app_: Application):
+    await outbox.drain()
+
+def build_application() -> Application:
+    builder = (
+        Application.builder()
+        .token(os.getenv("BOT_TOKEN"))
+        .base_url(cfg.TELEGRAM_API_URL)
+        .concurrent_updates(cfg.BOT_CONCURRENT_UPDATES)  # БД не блокирует loop — апдейты параллельно
+    )
+    if cfg.BOT_MODE == "webhook":
+        builder = builder.updater(None)  # апдейты принимает webhook.py
+    builder = builder.post_init(_start_outbox).post_stop(_drain_outbox)
+    app_ = builder.build()
+    app_.add_handler(CommandHandler("start", instrumented_command("start")(cmd_start)))
+    app_.add_handler(CommandHandler("balance", instrumented_command("balance")(cmd_balance)))
+    app_.add_handler(CommandHandler("addstars", instrumented_command("addstars")(cmd_addstars)))
+    app_.add_handler(CommandHandler("gifts", instrumented_command("gifts")(cmd_gifts)))
+    app_.add_handler(CommandHandler("fight", instrumented_command("fight")(cmd_fight)))
+    app_.add_handler(CommandHandler("pool", instrumented_command("pool")(cmd_pool)))
+    app_.add_handler(CommandHandler("top", instrumented_command("top")(cmd_top)))
+    app_.add_handler(CommandHandler("history", instrumented_command("history")(cmd_history)))
+    app_.add_handler(CommandHandler("mini", instrumented_command("mini")(cmd_mini)))
+    app_.add_handler(CommandHandler("setprice", instrumented_command("setprice")(cmd_setprice)))
+    app_.add_handler(CommandHandler("grant", instrumented_command("grant")(cmd_grant)))
+    return app_
+
+def run_bot(stop_signals=None):
+    """
+    Запуск в режиме BOT_MODE. По умолчанию без обработчиков сигналов — для фонового потока (python app.py).
+    """
+    if cfg.BOT_MODE == "webhook":
+        from webhook import serve_webhook
+        asyncio.run(serve_webhook(build_application(), stop_signals))
+    else:
+        build_application().run_polling(close_loop=False, stop_signals=stop_signals)
+
+if __name__ == "__main__":
+    init_db()  # создаёт недостающие таблицы и базовые подарки; существующие не трогает
+    gift_catalog.load()
+    resolver.start()  # закрывает и разыгрывает пулы; при RESOLVER_BATCH — ещё и дуэли
+    ledger_writer.start()  # заодно периодически сворачивает журнал в users.stars_balance
+    run_bot(stop_signals=(signal.SIGINT, signal.SIGTERM))
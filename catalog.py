@@ -0,0 +1,80 @@
+# catalog.py
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable
+from sqlalchemy.orm import Session
+from models import Gift, SessionLocal
+from config import get_config
+
+
+@dataclass(frozen=True)
+class GiftInfo:
+    id: int
+    code: str
+    title: str
+    value_stars: int
+
+
+class GiftCatalog:
+    """
+    Кэш справочника подарков в памяти процесса.
+    Таблица gifts крошечная и почти не меняется, поэтому держим её целиком:
+    читатели берут текущий снимок без блокировок, перезагрузка подменяет его целиком
+    и увеличивает version. После смены цен админом нужно вызвать invalidate().
+    Другие процессы об invalidate() не узнают — для них снимок перечитывается раз в ttl секунд (0 — никогда).
+    """
+
+    def __init__(self, ttl: float = 0):
+        self.ttl = ttl
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._by_code: Dict[str, GiftInfo] | None = None
+        self._by_id: Dict[int, GiftInfo] = {}
+        self.version = 0
+
+    def load(self, s: Session | None = None) -> int:
+        own = s is None
+        s = s or SessionLocal()
+        try:
+            rows = s.query(Gift.id, Gift.code, Gift.title, Gift.value_stars).all()
+        finally:
+            if own:
+                s.close()
+        by_code = {r.code: GiftInfo(r.id, r.code, r.title, r.value_stars) for r in rows}
+        with self._lock:
+            self._by_id = {g.id: g for g in by_code.values()}
+            self._by_code = by_code
+            self._loaded_at = time.monotonic()
+            self.version += 1
+            return self.version
+
+    def invalidate(self):
+        # следующий запрос перечитает таблицу
+        with self._lock:
+            self._by_code = None
+
+    def _snapshot(self) -> Dict[str, GiftInfo]:
+        snap = self._by_code
+        if snap is None or (self.ttl > 0 and time.monotonic() - self._loaded_at > self.ttl):
+            self.load()
+            snap = self._by_code or {}
+        return snap
+
+    def current_version(self) -> int:
+        # версия с учётом сброса: после invalidate() перечитывает таблицу
+        self._snapshot()
+        return self.version
+
+    def get(self, code: str) -> GiftInfo | None:
+        return self._snapshot().get(code)
+
+    def by_id(self, gift_id: int) -> GiftInfo | None:
+        self._snapshot()
+        return self._by_id.get(gift_id)
+
+    def all(self) -> Iterable[GiftInfo]:
+        return list(self._snapshot().values())
+
+
+gift_catalog = GiftCatalog(ttl=get_config().CACHE_TTL)
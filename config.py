@@ -7,6 +7,55 @@ class Config:
     DATABASE_URL: str
     APP_SECRET: str
     WEBAPP_URL: str
+    DB_EXECUTOR_WORKERS: int
+    BOT_CONCURRENT_UPDATES: int
+    MATCH_WAIT_SECONDS: float
+    MATCH_TOLERANCE: float
+    RESOLVER_BATCH: bool
+    RESOLVER_BATCH_SIZE: int
+    RESOLVER_INTERVAL_MS: int
+    RATE_LIMITS: str
+    RATE_LIMIT_BACKEND: str
+    RATE_LIMIT_DB_URL: str
+    LEDGER_FLUSH_MS: int
+    LEDGER_FOLD_SECONDS: float
+    SLOW_QUERY_MS: int
+    WEB_BIND: str
+    WEB_WORKERS: int
+    WEB_THREADS: int
+    CACHE_TTL: float
+    CACHE_MAX_USERS: int
+    DB_PROFILE: str
+    DATABASE_READ_URL: str
+    DB_POOL_SIZE: int
+    DB_MAX_OVERFLOW: int
+    DB_POOL_PRE_PING: bool
+    DB_POOL_RECYCLE: int
+    SQLITE_WAL: bool
+    SQLITE_BUSY_TIMEOUT_MS: int
+    SQLITE_MMAP_MB: int
+    TELEGRAM_API_URL: str
+    BOT_MODE: str
+    WEBHOOK_URL: str
+    WEBHOOK_PATH: str
+    WEBHOOK_LISTEN: str
+    WEBHOOK_SECRET: str
+    WEBHOOK_QUEUE_SIZE: int
+    WEBHOOK_MAX_CONNECTIONS: int
+    OUTBOX_GLOBAL_RATE: float
+    OUTBOX_CHAT_RATE: float
+    OUTBOX_CHAT_BURST: float
+    OUTBOX_MAX_IN_FLIGHT: int
+    OUTBOX_MAX_RETRIES: int
+    POOL_MAX_PLAYERS: int
+    POOL_LOCK_SECONDS: int
+    LEADERBOARD_SIZE: int
+    LEADERBOARD_REFRESH_SECONDS: float
+    ARCHIVE_AFTER_DAYS: int
+    ARCHIVE_BATCH_SIZE: int
+    SSE_MAX_SUBSCRIBERS: int
+    SSE_HEARTBEAT_SECONDS: float
+    SSE_STREAM_SECONDS: float
 
 def get_config() -> Config:
     c = Config()
@@ -15,4 +64,84 @@ def get_config() -> Config:
     c.DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///pvp.sqlite3")
     c.APP_SECRET = os.getenv("APP_SECRET", "change_me")
     c.WEBAPP_URL = os.getenv("WEBAPP_URL", "http://localhost:5000")
+    # пул потоков для обращений бота к БД и число одновременно обрабатываемых апдейтов
+    c.DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "8"))
+    c.BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", "32"))
+    # подбор соперника: сколько ждать живого игрока до боя с ботом и допустимый разброс ставок
+    c.MATCH_WAIT_SECONDS = float(os.getenv("MATCH_WAIT_SECONDS", "3"))
+    c.MATCH_TOLERANCE = float(os.getenv("MATCH_TOLERANCE", "0.25"))
+    # розыгрыш матчей пачками в фоновом потоке (resolver.py) вместо розыгрыша в запросе
+    c.RESOLVER_BATCH = os.getenv("RESOLVER_BATCH", "0") == "1"
+    c.RESOLVER_BATCH_SIZE = int(os.getenv("RESOLVER_BATCH_SIZE", "500"))
+    c.RESOLVER_INTERVAL_MS = int(os.getenv("RESOLVER_INTERVAL_MS", "20"))
+    # лимиты по командам/эндпоинтам: "действие=кол-во/секунд,...";
+    # backend: memory (один процесс) или sql (общий для нескольких процессов)
+    c.RATE_LIMITS = os.getenv("RATE_LIMITS", "fight=1/10,start_fight=1/10")
+    c.RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    c.RATE_LIMIT_DB_URL = os.getenv("RATE_LIMIT_DB_URL", "sqlite:///ratelimit.sqlite3")
+    # журнал баланса: окно группового коммита и период сворачивания в users.stars_balance
+    c.LEDGER_FLUSH_MS = int(os.getenv("LEDGER_FLUSH_MS", "5"))
+    c.LEDGER_FOLD_SECONDS = float(os.getenv("LEDGER_FOLD_SECONDS", "30"))
+    # SQL-запросы дольше порога пишутся в лог pvp.sql; 0 — выключено
+    c.SLOW_QUERY_MS = int(os.getenv("SLOW_QUERY_MS", "0"))
+    # веб-часть под gunicorn (gunicorn.conf.py): адрес, процессы и потоки на процесс
+    c.WEB_BIND = os.getenv("WEB_BIND", "0.0.0.0:5000")
+    c.WEB_WORKERS = int(os.getenv("WEB_WORKERS", str(min(4, os.cpu_count() or 1))))
+    c.WEB_THREADS = int(os.getenv("WEB_THREADS", "8"))
+    # срок жизни кэшей процесса (справочник подарков, снимки /api/me); 0 — бессрочно.
+    # Сбросы после коммита действуют только внутри процесса: бот и веб-воркеры — разные процессы,
+    # изменения из соседних видны не позже чем через CACHE_TTL секунд
+    c.CACHE_TTL = float(os.getenv("CACHE_TTL", "5"))
+    # снимков /api/me в памяти процесса не больше стольких: давно не читанные вытесняются (LRU)
+    c.CACHE_MAX_USERS = int(os.getenv("CACHE_MAX_USERS", "10000"))
+    # профиль engine: auto (по схеме URL), sqlite, postgresql или default (настройки SQLAlchemy)
+    c.DB_PROFILE = os.getenv("DB_PROFILE", "auto")
+    # реплика для чтений; пусто — отдельный пул к DATABASE_URL
+    c.DATABASE_READ_URL = os.getenv("DATABASE_READ_URL", "")
+    # пул PostgreSQL
+    c.DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    c.DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    c.DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+    c.DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    # SQLite: WAL + synchronous=NORMAL, ожидание блокировки вместо "database is locked", mmap
+    c.SQLITE_WAL = os.getenv("SQLITE_WAL", "1") == "1"
+    c.SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+    c.SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))
+    # Bot API; для локальных прогонов можно подставить поддельный сервер
+    c.TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org/bot")
+    # приём апдейтов: polling или webhook (webhook.py). WEBHOOK_URL — публичный адрес,
+    # по которому регистрируем вебхук (пусто — не регистрируем, например при локальной проверке)
+    c.BOT_MODE = os.getenv("BOT_MODE", "polling")
+    c.WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+    c.WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram/webhook")
+    c.WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0:8443")
+    c.WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET", "")
+    c.WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+    c.WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+    # исходящие сообщения (outbox.py): лимиты Telegram — около 30 сообщений/с на бота
+    # и порядка одного в секунду в чат; одновременных запросов к Bot API и повторов при сетевых ошибках
+    c.OUTBOX_GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", "25"))
+    c.OUTBOX_CHAT_RATE = float(os.getenv("OUTBOX_CHAT_RATE", "1"))
+    c.OUTBOX_CHAT_BURST = float(os.getenv("OUTBOX_CHAT_BURST", "3"))
+    c.OUTBOX_MAX_IN_FLIGHT = int(os.getenv("OUTBOX_MAX_IN_FLIGHT", "16"))
+    c.OUTBOX_MAX_RETRIES = int(os.getenv("OUTBOX_MAX_RETRIES", "3"))
+    # общий пул: закрывается, когда наберёт POOL_MAX_PLAYERS ставок или через POOL_LOCK_SECONDS
+    c.POOL_MAX_PLAYERS = int(os.getenv("POOL_MAX_PLAYERS", "1000"))
+    c.POOL_LOCK_SECONDS = int(os.getenv("POOL_LOCK_SECONDS", "60"))
+    # рейтинги (stats.py): сколько мест отдаём и как часто перечитываем топ из БД —
+    # матчи, разыгранные в других процессах, попадают в топ не позже чем через это время
+    c.LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "100"))
+    c.LEADERBOARD_REFRESH_SECONDS = float(os.getenv("LEADERBOARD_REFRESH_SECONDS", "30"))
+    # архив (archive.py): завершённые матчи старше ARCHIVE_AFTER_DAYS дней уходят из горячих таблиц
+    # транзакциями по ARCHIVE_BATCH_SIZE матчей
+    c.ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "30"))
+    c.ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "1000"))
+    # живые обновления (/api/stream, live.py): каждый поток занимает поток-обработчик веб-процесса,
+    # поэтому gunicorn получает SSE_MAX_SUBSCRIBERS потоков сверх WEB_THREADS (всего на сервер —
+    # WEB_WORKERS * SSE_MAX_SUBSCRIBERS подписок); раз в HEARTBEAT секунд снимок перечитывается
+    # (изменения из бота и соседних процессов), через STREAM секунд поток закрывается
+    # и клиент переподключается
+    c.SSE_MAX_SUBSCRIBERS = int(os.getenv("SSE_MAX_SUBSCRIBERS", "64"))
+    c.SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+    c.SSE_STREAM_SECONDS = float(os.getenv("SSE_STREAM_SECONDS", "300"))
     return c
@@ -0,0 +1,65 @@
+# db_executor.py
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable
+from models import SessionLocal, ReadSessionLocal
+from config import get_config
+
+_executor: ThreadPoolExecutor | None = None
+_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=get_config().DB_EXECUTOR_WORKERS, thread_name_prefix="db"
+                )
+    return _executor
+
+
+def _call_in_session(fn: Callable[..., Any], args, kwargs, session_factory=SessionLocal):
+    s = session_factory()
+    try:
+        return fn(s, *args, **kwargs)
+    finally:
+        s.close()
+
+
+async def run_db(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Выполняет синхронную fn(s, *args, **kwargs) в ограниченном пуле потоков
+    со своей сессией, не блокируя event loop бота.
+    fn должна возвращать простые данные, а не ORM-объекты: сессия закрывается сразу после вызова.
+    Контекст (contextvars, например маршрут для метрик) переносится в поток.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(ctx.run, _call_in_session, fn, args, kwargs)
+    )
+
+
+async def run_read(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Как run_db, но с сессией чтения (ReadSessionLocal: реплика или отдельный пул). fn ничего не пишет.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_executor(),
+        functools.partial(ctx.run, _call_in_session, fn, args, kwargs, ReadSessionLocal),
+    )
+
+
+def shutdown():
+    global _executor
+    with _lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
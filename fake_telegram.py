@@ -0,0 +1,107 @@
+# fake_telegram.py
+"""
+Поддельный Bot API для локальных прогонов: отвечает на getMe/sendMessage/setWebhook,
+запоминает отправленное и по желанию имитирует лимиты Telegram (429 с retry_after).
+
+    python fake_telegram.py --port 8081 --chat-rate 1
+    TELEGRAM_API_URL=http://127.0.0.1:8081/bot BOT_TOKEN=1:fake python bot.py
+
+В коде: api = FakeTelegramAPI(port=0).start(); api.url — для TELEGRAM_API_URL, api.sent — отправленное.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs
+
+
+class FakeTelegramAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081, chat_rate: float = 0, retry_after: int = 1):
+        self.chat_rate = chat_rate  # сообщений в секунду на чат до 429; 0 — без ограничений
+        self.retry_after = retry_after
+        self.sent: List[dict] = []
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._last_sent: Dict[int, float] = {}
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.api = self
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    def start(self) -> "FakeTelegramAPI":
+        threading.Thread(target=self._server.serve_forever, name="fake-telegram", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def call(self, method: str, params: dict) -> tuple:
+        if method == "getMe":
+            return 200, {"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "fake", "username": "fake_bot"}}
+        if method == "sendMessage":
+            chat_id = int(params["chat_id"])
+            with self._lock:
+                now = time.monotonic()
+                last = self._last_sent.get(chat_id)
+                if self.chat_rate and last is not None and now - last < 1 / self.chat_rate:
+                    self.rejected += 1
+                    return 429, {"ok": False, "error_code": 429,
+                                 "description": f"Too Many Requests: retry after {self.retry_after}",
+                                 "parameters": {"retry_after": self.retry_after}}
+                self._last_sent[chat_id] = now
+                self.sent.append({"chat_id": chat_id, "text": params.get("text", ""), "at": time.time()})
+                message_id = len(self.sent)
+            return 200, {"ok": True, "result": {
+                "message_id": message_id, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", ""),
+            }}
+        return 200, {"ok": True, "result": True}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        if "json" in self.headers.get("Content-Type", ""):
+            params = json.loads(body or b"{}")
+        else:
+            params = {k: v[0] for k, v in parse_qs(body.decode()).items()}
+        status, payload = self.server.api.call(self.path.rsplit("/", 1)[-1], params)
+        out = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(out)))
+        self.end_headers()
+        self.wfile.write(out)
+
+    do_GET = do_POST
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8081)
+    p.add_argument("--chat-rate", type=float, default=0, help="сообщений/с на чат до ответа 429")
+    p.add_argument("--retry-after", type=int, default=1)
+    args = p.parse_args(argv)
+    api = FakeTelegramAPI(args.host, args.port, args.chat_rate, args.retry_after).start()
+    print(f"TELEGRAM_API_URL={api.url}")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"sent={len(api.sent)} rejected={api.rejected}")
+    except KeyboardInterrupt:
+        api.stop()
+
+
+if __name__ == "__main__":
+    main()
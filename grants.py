@@ -0,0 +1,157 @@
+# grants.py
+"""
+Массовые начисления звёзд и подарков (промо). Строки CSV: tg_id,stars[,CODE:qty...]
+
+    123456,50
+    123457,0,ROSE:2,BOX:1
+
+    python grants.py promo.csv            — из файла ("-" — stdin)
+    /grant в боте (ADMIN_USER_ID)         — ответом на CSV-документ или строками после команды
+
+Файл читается потоково, пачками по chunk строк; каждая пачка — одна транзакция:
+пользователи — INSERT ... ON CONFLICT DO NOTHING RETURNING id, звёзды — проводки журнала одним executemany
+(post_entries), подарки — INSERT ... ON CONFLICT DO UPDATE по (user_id, gift_id).
+Новые пользователи получают стартовый бонус, как при первом входе (get_or_create_user).
+"""
+import argparse
+import csv
+import sys
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Tuple
+from dotenv import load_dotenv
+load_dotenv()  # до импорта модулей проекта: они читают конфиг при импорте
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from models import User, SessionLocal
+from catalog import gift_catalog
+from logic import WELCOME_BONUS
+from ledger import post_entries
+from user_state import touch_users
+
+Grant = Tuple[int, int, Dict[str, int]]  # (tg_id, stars, {code: qty})
+
+_DIALECT_INSERT = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+
+_UPSERT_INVENTORY = text(
+    "INSERT INTO inventory_items (user_id, gift_id, qty) VALUES (:user_id, :gift_id, :qty) "
+    "ON CONFLICT (user_id, gift_id) DO UPDATE SET qty = inventory_items.qty + excluded.qty"
+)
+
+
+def parse_grants(lines: Iterable[str], errors: List[str]) -> Iterator[Grant]:
+    """
+    Разбирает CSV построчно. Заголовок (первая ячейка не число) и пустые строки пропускаются;
+    битые строки не начисляются, а попадают в errors с номером строки.
+    """
+    for n, row in enumerate(csv.reader(lines), 1):
+        if not row or not row[0].strip() or (n == 1 and not row[0].strip().isdigit()):
+            continue
+        try:
+            tg_id = int(row[0])
+            stars = int(row[1]) if len(row) > 1 and row[1].strip() else 0
+            gifts: Dict[str, int] = {}
+            for cell in row[2:]:
+                if not cell.strip():
+                    continue
+                code, qty = cell.split(":")
+                code = code.strip().upper()
+                if not gift_catalog.get(code):
+                    raise ValueError(f"неизвестный подарок {code}")
+                gifts[code] = gifts.get(code, 0) + int(qty)
+            if stars < 0 or any(q <= 0 for q in gifts.values()):
+                raise ValueError("начисление должно быть положительным")
+        except ValueError as e:
+            errors.append(f"строка {n}: {e}")
+            continue
+        yield tg_id, stars, gifts
+
+
+def _create_users(s: Session, tg_ids: Iterable[int], now: datetime) -> List[int]:
+    """
+    INSERT ... ON CONFLICT (tg_id) DO NOTHING RETURNING id: id только действительно созданных.
+    """
+    insert = _DIALECT_INSERT[s.get_bind().dialect.name]
+    stmt = insert(User).on_conflict_do_nothing(index_elements=[User.tg_id]).returning(User.id)
+    return list(s.scalars(stmt, [{"tg_id": tg_id, "stars_balance": 0, "created_at": now} for tg_id in tg_ids]))
+
+
+def grant_chunk(s: Session, grants: List[Grant], reason: str = "promo") -> dict:
+    """
+    Одна пачка одной транзакцией. Повторы tg_id внутри пачки складываются.
+    """
+    stars_of: Dict[int, int] = {}
+    gifts_of: Dict[Tuple[int, int], int] = {}
+    for tg_id, stars, gifts in grants:
+        stars_of[tg_id] = stars_of.get(tg_id, 0) + stars
+        for code, qty in gifts.items():
+            key = (tg_id, gift_catalog.get(code).id)
+            gifts_of[key] = gifts_of.get(key, 0) + qty
+    now = datetime.utcnow()
+    # стартовый бонус — только созданным этой пачкой; повтор CSV его не удвоит
+    created = _create_users(s, stars_of, now)
+    user_of = dict(s.execute(select(User.tg_id, User.id).where(User.tg_id.in_(stars_of))).all())
+    post_entries(s, [{"user_id": user_id, "delta": WELCOME_BONUS, "reason": "bonus"} for user_id in created]
+                 + [{"user_id": user_of[tg_id], "delta": stars, "reason": reason}
+                    for tg_id, stars in stars_of.items() if stars])
+    if gifts_of:
+        s.execute(_UPSERT_INVENTORY, [{"user_id": user_of[tg_id], "gift_id": gift_id, "qty": qty}
+                                      for (tg_id, gift_id), qty in gifts_of.items()])
+        touch_users(s, *{user_of[tg_id] for tg_id, _ in gifts_of})
+    s.commit()
+    return {"users": len(stars_of), "created": len(created),
+            "stars": sum(stars_of.values()), "gifts": sum(gifts_of.values())}
+
+
+def bulk_grant(s: Session, lines: Iterable[str], chunk: int = 5000, reason: str = "promo",
+               progress=None) -> dict:
+    """
+    Начисляет всё из CSV пачками по chunk строк. progress(итог_на_сейчас) — после каждой пачки.
+    Возвращает {"rows", "users", "created", "stars", "gifts", "errors"}; users считается по пачкам.
+    """
+    errors: List[str] = []
+    total = {"rows": 0, "users": 0, "created": 0, "stars": 0, "gifts": 0, "errors": errors}
+    grants = parse_grants(lines, errors)
+    while True:
+        batch = list(islice(grants, chunk))
+        if not batch:
+            break
+        res = grant_chunk(s, batch, reason)
+        total["rows"] += len(batch)
+        for k, v in res.items():
+            total[k] += v
+        if progress:
+            progress(total)
+    return total
+
+
+def summary_text(total: dict) -> str:
+    out = (f"Строк: {total['rows']}, пользователей: {total['users']} (новых {total['created']}), "
+           f"⭐️{total['stars']}, подарков: {total['gifts']}")
+    if total["errors"]:
+        out += f"\nОшибок: {len(total['errors'])}\n" + "\n".join(total["errors"][:20])
+    return out
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("path", help='CSV-файл или "-" для stdin')
+    p.add_argument("--chunk", type=int, default=5000, help="строк в транзакции")
+    p.add_argument("--reason", default="promo", help="причина в журнале")
+    args = p.parse_args(argv)
+    f = sys.stdin if args.path == "-" else open(args.path, newline="", encoding="utf-8-sig")
+    gift_catalog.load()
+    s = SessionLocal()
+    try:
+        total = bulk_grant(s, f, args.chunk, args.reason,
+                           progress=lambda t: print(f"строк: {t['rows']}", flush=True))
+    finally:
+        s.close()
+        if f is not sys.stdin:
+            f.close()
+    print(summary_text(total))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# gunicorn.conf.py
+# Веб-часть: gunicorn -c gunicorn.conf.py wsgi:application
+# Число процессов и потоков — WEB_WORKERS / WEB_THREADS, адрес — WEB_BIND.
+# Поток SSE (/api/stream) держит обработчик всё время подписки, поэтому каждому воркеру
+# добавляем SSE_MAX_SUBSCRIBERS потоков сверх WEB_THREADS: подписки не отнимают их у запросов.
+# Поток в ожидании почти ничего не стоит; если подписчиков тысячи — вынесите /api/stream
+# в отдельный экземпляр gunicorn (тот же wsgi:application) с большим SSE_MAX_SUBSCRIBERS.
+# Воркеры — отдельные процессы, поэтому в памяти у каждого своё:
+#   - очередь подбора соперников (matchmaker): пары складываются внутри воркера,
+#     потоки (WEB_THREADS) дают ждущим заявкам встретиться;
+#   - лимиты запросов: для общего счёта между воркерами RATE_LIMIT_BACKEND=sql;
+#   - кэши справочника подарков и снимков /api/me: изменения из других процессов
+#     (цены от /setprice, бои в боте) видны не позже CACHE_TTL секунд (по умолчанию 5).
+#   - метрики /metrics: у каждой серии метка pid, отвечает тот воркер, к которому попал запрос;
+#     суммируйте без pid, серии соседних воркеров обновляются по мере того, как скрейп до них доходит.
+# Резолвер (пулы, при RESOLVER_BATCH — ещё и дуэли) работает в каждом воркере, бот для этого не нужен.
+# Журнал баланса сворачивает каждый воркер (ledger_writer), как и бот; вручную — python ledger.py fold.
+from dotenv import load_dotenv
+load_dotenv()
+from config import get_config
+
+_cfg = get_config()
+
+bind = _cfg.WEB_BIND
+workers = _cfg.WEB_WORKERS
+threads = _cfg.WEB_THREADS + _cfg.SSE_MAX_SUBSCRIBERS
+worker_class = "gthread"
+# запросы ждут соперника до MATCH_WAIT_SECONDS — таймаут воркера с запасом
+timeout = max(30, int(_cfg.MATCH_WAIT_SECONDS) + 30)
+# приложение грузится в каждом воркере: соединения с БД и потоки не переживают fork
+preload_app = False
+accesslog = "-"
+
+
+def on_starting(server):
+    # схему и базовые подарки создаёт мастер один раз, до fork: воркеры не гоняются за create_all
+    from models import engine, init_db
+    init_db()
+    engine.dispose()  # соединения мастера не должны достаться воркерам
+
+
+def post_fork(server, worker):
+    from wsgi import start_worker
+    start_worker()
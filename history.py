@@ -0,0 +1,88 @@
+# history.py
+"""
+История матчей игрока, новые сверху. Пагинация по ключу (bets.created_at, match_id), без OFFSET:
+страница — диапазон индекса ix_bets_user_created от курсора, поэтому её стоимость
+не зависит от того, сколько матчей у игрока и какую страницу листаем.
+Читаем и горячие таблицы, и архив (archive.py): из каждой — страница по своему индексу, затем слияние.
+"""
+import heapq
+from datetime import datetime
+from typing import List, Tuple
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import Session
+from models import Bet, BetArchive, Match, MatchArchive, MatchStatus, User
+
+MAX_PAGE = 100
+
+
+def encode_cursor(created_at: datetime, match_id: int) -> str:
+    # одним словом без пробелов — подходит и для query string, и для аргумента команды бота
+    return f"{created_at.isoformat()}_{match_id}"
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    ValueError — битый курсор.
+    """
+    at, _, match_id = cursor.rpartition("_")
+    return datetime.fromisoformat(at), int(match_id)
+
+
+def _outcome(status: MatchStatus, winner_user_id: int | None, user_id: int) -> str:
+    if status == MatchStatus.RESOLVED:
+        return "win" if winner_user_id == user_id else "loss"
+    if status == MatchStatus.CANCELED:
+        return "canceled"
+    return "pending"
+
+
+def user_history(s: Session, user_id: int, limit: int = 20, cursor: str | None = None) -> Tuple[List[dict], str | None]:
+    """
+    Страница истории: (матчи, курсор следующей страницы или None, если это последняя).
+    """
+    limit = max(1, min(limit, MAX_PAGE))
+    key = decode_cursor(cursor) if cursor else None
+    pages = []
+    for bet, match in ((Bet, Match), (BetArchive, MatchArchive)):
+        q = (
+            select(bet.match_id, bet.created_at, bet.value_stars, match.currency, match.status,
+                   match.winner_user_id, match.total_value_stars, match.bets_count, match.resolved_at)
+            .join(match, match.id == bet.match_id)
+            .where(bet.user_id == user_id)
+            .order_by(bet.created_at.desc(), bet.match_id.desc())
+            .limit(limit + 1)
+        )
+        if key:
+            q = q.where(tuple_(bet.created_at, bet.match_id) < tuple_(*key))
+        pages.append(s.execute(q).all())
+    # горячие читаем раньше архива: матч, перенесённый между запросами, попадёт в обе выборки, но не пропадёт
+    rows, seen = [], set()
+    for r in heapq.merge(*pages, key=lambda r: (r.created_at, r.match_id), reverse=True):
+        if r.match_id in seen:
+            continue
+        seen.add(r.match_id)
+        rows.append(r)
+        if len(rows) > limit:
+            break
+    items = [{
+        "match_id": r.match_id,
+        "created_at": r.created_at,
+        "resolved_at": r.resolved_at,
+        "currency": r.currency.value,
+        "stake": r.value_stars,
+        "pool": r.total_value_stars,
+        "players": r.bets_count,
+        "outcome": _outcome(r.status, r.winner_user_id, user_id),
+    } for r in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = encode_cursor(last.created_at, last.match_id)
+    return items, next_cursor
+
+
+def history_by_tg(s: Session, tg_id: int, limit: int = 20, cursor: str | None = None) -> Tuple[List[dict], str | None]:
+    user_id = s.scalar(select(User.id).where(User.tg_id == tg_id))
+    if user_id is None:
+        return [], None
+    return user_history(s, user_id, limit, cursor)
@@ -0,0 +1,247 @@
+# ledger.py
+"""
+Журнал баланса: проводки, снимок users.stars_balance + хвост после отметки, групповой коммит.
+
+    python ledger.py fold   — свернуть весь хвост журнала в снимок (например, из cron)
+"""
+import argparse
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Iterable, List
+from dotenv import load_dotenv
+load_dotenv()  # до импорта модулей проекта: они читают конфиг при импорте
+from sqlalchemy import Integer, String, DateTime, func, insert, literal, select, text, update
+from sqlalchemy.orm import Session
+from models import User, LedgerEntry, LedgerSnapshot, SessionLocal
+from user_state import touch_users
+from config import get_config
+
+log = logging.getLogger(__name__)
+
+entries_t = LedgerEntry.__table__
+
+
+def _serial_writes(s: Session) -> bool:
+    # SQLite: писатель один, id проводок выдаются и коммитятся по порядку
+    return s.get_bind().dialect.name == "sqlite"
+
+
+def _watermark():
+    return select(func.coalesce(func.max(LedgerSnapshot.last_entry_id), 0)).scalar_subquery()
+
+
+def _balance_expr(user_id: int):
+    # снимок + проводки после отметки
+    pending = (
+        select(func.coalesce(func.sum(entries_t.c.delta), 0))
+        .where(entries_t.c.user_id == user_id, entries_t.c.id > _watermark())
+        .scalar_subquery()
+    )
+    snapshot = select(User.stars_balance).where(User.id == user_id).scalar_subquery()
+    return snapshot + pending
+
+
+def balance_of(s: Session, user_id: int) -> int:
+    return s.execute(select(_balance_expr(user_id))).scalar_one() or 0
+
+
+def post_entry(s: Session, user_id: int, delta: int, reason: str,
+               match_id: int | None = None, require_funds: bool = False) -> bool:
+    """
+    Добавляет проводку в текущую транзакцию (без commit). Строку users не трогает.
+    require_funds — списание только если баланс (снимок + проводки) не уйдёт в минус:
+    проверка и вставка одним INSERT ... SELECT ... WHERE. На SQLite писатели сериализуются;
+    на остальных БД сначала блокируем строку пользователя (SELECT ... FOR UPDATE), иначе два
+    списания под READ COMMITTED увидят один и тот же баланс. Проверка идёт отдельным запросом
+    после блокировки, поэтому видит проводки закоммитившегося соперника.
+    """
+    if require_funds and not _serial_writes(s):
+        s.execute(select(User.id).where(User.id == user_id).with_for_update())
+    row = select(
+        literal(user_id, Integer), literal(delta, Integer), literal(reason, String),
+        literal(match_id, Integer), literal(datetime.utcnow(), DateTime),
+    )
+    if require_funds:
+        row = row.where(_balance_expr(user_id) >= -delta)
+    res = s.execute(
+        insert(entries_t).from_select(["user_id", "delta", "reason", "match_id", "created_at"], row)
+    )
+    if res.rowcount != 1:
+        return False
+    touch_users(s, user_id)
+    return True
+
+
+def post_entries(s: Session, entries: List[dict]):
+    """
+    Пачка начислений одним executemany: [{"user_id", "delta", "reason", "match_id"}].
+    """
+    if not entries:
+        return
+    now = datetime.utcnow()
+    s.execute(insert(entries_t), [{"match_id": None, "created_at": now, **e} for e in entries])
+    touch_users(s, *{e["user_id"] for e in entries})
+
+
+def fold_snapshot(s: Session, max_entries: int = 50_000) -> int:
+    """
+    Сворачивает проводки после отметки в users.stars_balance и сдвигает отметку — одной транзакцией,
+    так что снимок + хвост для читателей не меняется.
+    Отметка не должна обогнать незакоммиченную проводку с меньшим id — иначе та окажется под отметкой
+    и в баланс не попадёт. На SQLite так не бывает (id выдаются под единственной блокировкой записи).
+    На PostgreSQL последовательность раздаёт id вне порядка коммитов, поэтому берём EXCLUSIVE-блокировку
+    журнала: она дожидается всех пишущих в него транзакций и держит новые до нашего commit.
+    lock_timeout короче deadlock_timeout: если мы встали в цикл с писателем, уступает сворачивание,
+    а не запрос пользователя — свернём в следующий раз.
+    Возвращает число свёрнутых проводок.
+    """
+    if not _serial_writes(s):
+        s.execute(text("SET LOCAL lock_timeout = '500ms'"))
+        s.execute(text(f"LOCK TABLE {entries_t.name} IN EXCLUSIVE MODE"))
+    lo = s.execute(select(_watermark())).scalar_one()
+    hi = s.execute(
+        select(func.max(entries_t.c.id))
+        .where(entries_t.c.id > lo, entries_t.c.id <= lo + max_entries)
+    ).scalar_one()
+    if hi is None:
+        return 0
+    window = (entries_t.c.id > lo) & (entries_t.c.id <= hi)
+    folded = (
+        select(func.sum(entries_t.c.delta))
+        .where(entries_t.c.user_id == User.id, window)
+        .scalar_subquery()
+    )
+    s.execute(
+        update(User)
+        .where(User.id.in_(select(entries_t.c.user_id).where(window).distinct()))
+        .values(stars_balance=User.stars_balance + folded)
+        .execution_options(synchronize_session=False)
+    )
+    snap = s.get(LedgerSnapshot, 1)
+    if snap is None:
+        s.add(LedgerSnapshot(id=1, last_entry_id=hi, folded_at=datetime.utcnow()))
+    else:
+        snap.last_entry_id, snap.folded_at = hi, datetime.utcnow()
+    s.commit()
+    return hi - lo
+
+
+class GroupCommitWriter:
+    """
+    Групповой коммит отдельных проводок (сейчас — /addstars): запросы кладут проводку в очередь
+    и ждут Future, поток раз в interval секунд пишет всё накопленное одной транзакцией (один fsync на пачку).
+    Проводки боёв, пулов и выплат сюда не идут: они атомарны со своим матчем и пишутся его транзакцией
+    (post_entries — одним executemany; при RESOLVER_BATCH выплаты пачки матчей — одним commit).
+    Тот же поток раз в fold_interval секунд сворачивает журнал в снимок (fold_snapshot) —
+    его запускают бот и каждый веб-воркер; одновременные сворачивания не пересекаются
+    (SQLite — один писатель, PostgreSQL — блокировка журнала).
+    """
+
+    def __init__(self, interval: float = 0.005, max_batch: int = 1000, fold_interval: float = 30.0):
+        self.interval = interval
+        self.max_batch = max_batch
+        self.fold_interval = fold_interval
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._last_fold = time.monotonic()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ledger-writer", daemon=True)
+                self._thread.start()
+
+    def submit(self, user_id: int, delta: int, reason: str,
+               match_id: int | None = None, require_funds: bool = False) -> Future:
+        """
+        Future[bool]: False — списание отклонено (не хватило средств).
+        """
+        self.start()
+        fut: Future = Future()
+        self._queue.put(((user_id, delta, reason, match_id, require_funds), fut))
+        return fut
+
+    def _drain(self) -> List[tuple]:
+        # queue.Empty, если за секунду ничего не пришло — чтобы не пропускать сворачивание
+        batch = [self._queue.get(timeout=1.0)]
+        deadline = time.monotonic() + self.interval
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def write_batch(self, batch: Iterable[tuple]):
+        batch = list(batch)
+        s = SessionLocal()
+        try:
+            results = [post_entry(s, *args) for args, _ in batch]
+            s.commit()
+        except Exception as e:
+            s.rollback()
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        finally:
+            s.close()
+        for (_, fut), ok in zip(batch, results):
+            fut.set_result(ok)
+
+    def _maybe_fold(self):
+        if time.monotonic() - self._last_fold < self.fold_interval:
+            return
+        self._last_fold = time.monotonic()
+        s = SessionLocal()
+        try:
+            fold_snapshot(s)
+        except Exception:
+            s.rollback()
+            log.exception("ledger fold failed")
+        finally:
+            s.close()
+
+    def _run(self):
+        while True:
+            try:
+                self.write_batch(self._drain())
+            except queue.Empty:
+                pass
+            self._maybe_fold()
+
+
+_cfg = get_config()
+ledger_writer = GroupCommitWriter(
+    interval=_cfg.LEDGER_FLUSH_MS / 1000, fold_interval=_cfg.LEDGER_FOLD_SECONDS
+)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("command", choices=["fold"])
+    p.add_argument("--chunk", type=int, default=50_000, help="проводок в транзакции")
+    args = p.parse_args(argv)
+    s = SessionLocal()
+    total = 0
+    try:
+        while True:
+            n = fold_snapshot(s, args.chunk)
+            if not n:
+                break
+            total += n
+            print(f"свёрнуто: {total}", flush=True)
+    finally:
+        s.close()
+    print(f"готово: {total}")
+
+
+if __name__ == "__main__":
+    main()
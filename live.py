@@ -0,0 +1,105 @@
+# live.py
+"""
+Живые обновления для мини-приложения: pub/sub внутри процесса, user_id -> подписки (SSE-потоки web.py).
+Пишущие пути кладут события в сессию (queue_events), публикуются они только после commit;
+сам факт изменения баланса/инвентаря публикует user_state по touch_users.
+Изменения из других процессов (бот, соседние воркеры gunicorn) сюда не доходят —
+поток подхватывает их, перечитывая снимок раз в SSE_HEARTBEAT_SECONDS.
+"""
+import queue
+import threading
+from typing import Dict, Iterable, List, Set, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from config import get_config
+
+STATE_CHANGED = {"type": "state"}  # баланс или инвентарь изменились — подписчик перечитает снимок
+
+
+class Subscription:
+    def __init__(self, user_id: int, size: int):
+        self.user_id = user_id
+        self.lost = False  # очередь переполнялась — часть событий потеряна, нужен полный снимок
+        self._q: "queue.Queue[dict]" = queue.Queue(maxsize=size)
+
+    def put(self, ev: dict):
+        try:
+            self._q.put_nowait(ev)
+        except queue.Full:
+            self.lost = True
+
+    def get(self, timeout: float) -> dict | None:
+        try:
+            return self._q.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Hub:
+    """
+    Подписки процесса. Каждый SSE-поток держит поток-обработчик gunicorn (под них в gunicorn.conf.py
+    выделены отдельные потоки), поэтому подписок не больше max_subscribers на процесс
+    и max_per_user на пользователя; сверх лимита subscribe
+    возвращает None, и клиент остаётся на опросе /api/me. publish не блокируется: медленный
+    подписчик теряет события (lost) и получает полный снимок.
+    """
+
+    def __init__(self, max_subscribers: int = 4, max_per_user: int = 2, queue_size: int = 100):
+        self.max_subscribers = max_subscribers
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subs: Dict[int, Set[Subscription]] = {}
+        self._count = 0
+
+    def subscribe(self, user_id: int) -> Subscription | None:
+        with self._lock:
+            subs = self._subs.setdefault(user_id, set())
+            if self._count >= self.max_subscribers or len(subs) >= self.max_per_user:
+                if not subs:
+                    del self._subs[user_id]
+                return None
+            sub = Subscription(user_id, self.queue_size)
+            subs.add(sub)
+            self._count += 1
+            return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            subs = self._subs.get(sub.user_id)
+            if subs and sub in subs:
+                subs.discard(sub)
+                self._count -= 1
+                if not subs:
+                    del self._subs[sub.user_id]
+
+    def publish(self, user_id: int, ev: dict):
+        with self._lock:
+            subs = list(self._subs.get(user_id, ()))
+        for sub in subs:
+            sub.put(ev)
+
+    def publish_many(self, events: Iterable[Tuple[int, dict]]):
+        for user_id, ev in events:
+            self.publish(user_id, ev)
+
+
+_cfg = get_config()
+hub = Hub(max_subscribers=_cfg.SSE_MAX_SUBSCRIBERS)
+
+
+def queue_events(s: Session, events: List[Tuple[int, dict]]):
+    # уйдут подписчикам после commit сессии; при откате — пропадут
+    s.info.setdefault("live_events", []).extend(events)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_events(s: Session):
+    events = s.info.pop("live_events", None)
+    if events:
+        hub.publish_many(events)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_events(s: Session, previous_transaction):
+    s.info.pop("live_events", None)
@@ -1,48 +1,86 @@
 # logic.py
+from sqlalchemy import bindparam, case, func, literal, or_, select, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from models import (
-    User, Gift, InventoryItem, Match, Bet, Currency, MatchStatus, SessionLocal
+    BOT_OPPONENT_USERNAME, User, Gift, InventoryItem, Match, Bet, BetGift, Currency, MatchStatus, SessionLocal
 )
-from typing import Dict, Tuple
+from catalog import gift_catalog
+from user_state import touch_users
+from ledger import balance_of, post_entry, post_entries
+from metrics import phase
+from stats import match_deltas, record_results
+from live import queue_events
+from config import get_config
+from typing import Callable, Dict, List, Tuple
+from bisect import bisect_right
+from itertools import accumulate
+import logging
 import random
 from datetime import datetime, timedelta
 
+log = logging.getLogger(__name__)
+
 COMMISSION_PCT = 0.05
+WELCOME_BONUS = 100  # стартовый бонус новому пользователю, ⭐️
+
+# ставка: int — звёзды, {code: qty} — подарки
+Stake = int | Dict[str, int]
 
 # --- утилиты ---
 
-def get_or_create_user(s: Session, tg_id: int, username: str | None = None) -> User:
+def _done(s: Session, commit: bool):
+    # commit=False — функция работает внутри чужой транзакции (см. run_fight)
+    if commit:
+        s.commit()
+    else:
+        s.flush()
+
+def get_or_create_user(s: Session, tg_id: int, username: str | None = None, commit: bool = True) -> User:
     user = s.query(User).filter_by(tg_id=tg_id).one_or_none()
     if not user:
-        user = User(tg_id=tg_id, username=username or None, stars_balance=100)  # стартовый бонус
+        user = User(tg_id=tg_id, username=username or None, stars_balance=0)
         s.add(user)
-        s.commit()
+        s.flush()
+        post_entry(s, user.id, WELCOME_BONUS, "bonus")
+        _done(s, commit)
     return user
 
-def add_stars(s: Session, user: User, amount: int):
-    user.stars_balance += amount
-    s.commit()
+def credit_stars(s: Session, user_id: int, amount: int, reason: str = "grant", match_id: int | None = None):
+    # проводка в журнал; строку users не трогаем — она обновляется сворачиванием (ledger.fold_snapshot)
+    post_entry(s, user_id, amount, reason, match_id)
+
+def add_stars(s: Session, user: User, amount: int, commit: bool = True):
+    credit_stars(s, user.id, amount)
+    _done(s, commit)
 
-def take_stars(s: Session, user: User, amount: int) -> bool:
-    if user.stars_balance < amount:
+def take_stars(s: Session, user: User, amount: int, commit: bool = True,
+               reason: str = "debit", match_id: int | None = None) -> bool:
+    # условное списание: не даёт уйти в минус даже при гонке параллельных запросов
+    if not post_entry(s, user.id, -amount, reason, match_id, require_funds=True):
         return False
-    user.stars_balance -= amount
-    s.commit()
+    _done(s, commit)
     return True
 
-def inventory_delta(s: Session, user: User, gift_code: str, qty_delta: int) -> bool:
-    gift = s.query(Gift).filter_by(code=gift_code).one_or_none()
+def inventory_delta(s: Session, user: User, gift_code: str, qty_delta: int, commit: bool = True) -> bool:
+    gift = gift_catalog.get(gift_code)
     if not gift:
         return False
-    row = s.query(InventoryItem).filter_by(user_id=user.id, gift_id=gift.id).one_or_none()
-    if not row:
-        row = InventoryItem(user_id=user.id, gift_id=gift.id, qty=0)
-        s.add(row)
-        s.flush()
-    if row.qty + qty_delta < 0:
-        return False
-    row.qty += qty_delta
-    s.commit()
+    stmt = (
+        update(InventoryItem)
+        .where(InventoryItem.user_id == user.id, InventoryItem.gift_id == gift.id)
+        .values(qty=InventoryItem.qty + qty_delta)
+        .execution_options(synchronize_session=False)
+    )
+    if qty_delta < 0:
+        stmt = stmt.where(InventoryItem.qty >= -qty_delta)
+    res = s.execute(stmt)
+    if res.rowcount != 1:
+        if qty_delta < 0:
+            return False
+        s.add(InventoryItem(user_id=user.id, gift_id=gift.id, qty=qty_delta))
+    touch_users(s, user.id)
+    _done(s, commit)
     return True
 
 def parse_gifts_blob(blob: str) -> Dict[str, int]:
@@ -58,7 +96,7 @@ def parse_gifts_blob(blob: str) -> Dict[str, int]:
 def gifts_value(s: Session, gifts: Dict[str, int]) -> int:
     total = 0
     for code, qty in gifts.items():
-        gift = s.query(Gift).filter_by(code=code).one_or_none()
+        gift = gift_catalog.get(code)
         if not gift:
             continue
         total += gift.value_stars * qty
@@ -68,7 +106,7 @@ def cheapest_gift_in_pool(s: Session, gifts: Dict[str, int]) -> Tuple[str | None
     cheapest_code = None
     cheapest_value = 10**9
     for code, qty in gifts.items():
-        gift = s.query(Gift).filter_by(code=code).one_or_none()
+        gift = gift_catalog.get(code)
         if gift and qty > 0 and gift.value_stars < cheapest_value:
             cheapest_value = gift.value_stars
             cheapest_code = code
@@ -76,117 +114,491 @@ def cheapest_gift_in_pool(s: Session, gifts: Dict[str, int]) -> Tuple[str | None
         return None, 0
     return cheapest_code, cheapest_value
 
+def set_gift_price(s: Session, gift_code: str, value_stars: int) -> bool:
+    """
+    Смена номинала подарка (админка). Сбрасывает кэш справочника подарков.
+    """
+    if value_stars <= 0:
+        return False
+    gift = s.query(Gift).filter_by(code=gift_code).one_or_none()
+    if not gift:
+        return False
+    gift.value_stars = value_stars
+    s.commit()
+    gift_catalog.invalidate()
+    return True
+
 # --- PvP ---
 
-def create_match(s: Session, currency: Currency) -> Match:
-    m = Match(status=MatchStatus.OPEN, currency=currency)
+def create_match(s: Session, currency: Currency, commit: bool = True,
+                 max_players: int = 2, lock_at: datetime | None = None) -> Match:
+    m = Match(status=MatchStatus.OPEN, currency=currency, max_players=max_players, lock_at=lock_at)
     s.add(m)
-    s.commit()
+    _done(s, commit)
     return m
 
-def place_bet_stars(s: Session, m: Match, user: User, amount: int) -> Tuple[bool, str]:
+def _add_bet(m: Match, bet: Bet, value: int):
+    bet.match = m
+    m.total_value_stars += value
+    m.bets_count += 1
+    # набралось max_players ставок — блокируем матч, чтобы не заливали лишние
+    if m.bets_count >= m.max_players:
+        m.status = MatchStatus.LOCKED
+
+def _stars_bet(s: Session, match_id: int, user: User, amount: int) -> Tuple[bool, str, Bet | None]:
+    # списание и ставка (ещё не добавленная в сессию); общее для дуэли и пула
+    if amount <= 0:
+        return False, "Ставка должна быть больше нуля.", None
+    if not take_stars(s, user, amount, commit=False, reason="bet", match_id=match_id):
+        return False, "Недостаточно звёзд.", None
+    return True, f"Ставка {amount} ⭐️ принята.", Bet(
+        match_id=match_id, user_id=user.id, amount_stars=amount, value_stars=amount
+    )
+
+def _gifts_bet(s: Session, match_id: int, user: User, gifts: Dict[str, int],
+               commit: bool) -> Tuple[bool, str, Bet | None]:
+    if not gifts:
+        return False, "Не указаны подарки.", None
+    for code, qty in gifts.items():
+        if qty <= 0: return False, "Кол-во подарков должно быть > 0.", None
+        if not gift_catalog.get(code):
+            return False, f"Подарок {code} не существует.", None
+    # списание условными UPDATE; частичное списание откатывается
+    for code, qty in gifts.items():
+        if not inventory_delta(s, user, code, -qty, commit=False):
+            if commit:
+                s.rollback()
+            return False, f"Недостаточно подарков {code}.", None
+    val = gifts_value(s, gifts)
+    bet = Bet(match_id=match_id, user_id=user.id, value_stars=val)
+    bet.gifts = [BetGift(gift_id=gift_catalog.get(c).id, qty=q) for c, q in gifts.items()]
+    return True, f"Ставка подарками на {val} ⭐️ (номинал) принята.", bet
+
+def place_bet_stars(s: Session, m: Match, user: User, amount: int, commit: bool = True) -> Tuple[bool, str]:
     if m.status != MatchStatus.OPEN:
         return False, "Матч недоступен для ставок."
-    if amount <= 0:
-        return False, "Ставка должна быть больше нуля."
-    if not take_stars(s, user, amount):
-        return False, "Недостаточно звёзд."
-    bet = Bet(match_id=m.id, user_id=user.id, amount_stars=amount, value_stars=amount)
+    ok, msg, bet = _stars_bet(s, m.id, user, amount)
+    if not ok:
+        return False, msg
     s.add(bet)
-    m.total_value_stars += amount
-    # если это вторая ставка — блокируем матч, чтобы не заливали третьи
-    if len(m.bets) + 1 >= 2:
-        m.status = MatchStatus.LOCKED
-    s.commit()
-    return True, f"Ставка {amount} ⭐️ принята."
+    _add_bet(m, bet, amount)
+    _done(s, commit)
+    return True, msg
 
-def place_bet_gifts(s: Session, m: Match, user: User, gifts: Dict[str, int]) -> Tuple[bool, str]:
+def place_bet_gifts(s: Session, m: Match, user: User, gifts: Dict[str, int], commit: bool = True) -> Tuple[bool, str]:
     if m.status != MatchStatus.OPEN:
         return False, "Матч недоступен для ставок."
-    # списываем подарки из инвентаря
-    # проверим, хватает ли
-    for code, qty in gifts.items():
-        if qty <= 0: return False, "Кол-во подарков должно быть > 0."
-        gift_row = s.query(Gift).filter_by(code=code).one_or_none()
-        if not gift_row:
-            return False, f"Подарок {code} не существует."
-        inv = s.query(InventoryItem).filter_by(user_id=user.id, gift_id=gift_row.id).one_or_none()
-        if not inv or inv.qty < qty:
-            return False, f"Недостаточно подарков {code}."
-    # списание
-    for code, qty in gifts.items():
-        inventory_delta(s, user, code, -qty)
-    val = gifts_value(s, gifts)
-    blob = ",".join([f"{c}:{q}" for c, q in gifts.items()])
-    bet = Bet(match_id=m.id, user_id=user.id, gifts_blob=blob, value_stars=val)
+    ok, msg, bet = _gifts_bet(s, m.id, user, gifts, commit)
+    if not ok:
+        return False, msg
     s.add(bet)
-    m.total_value_stars += val
-    if len(m.bets) + 1 >= 2:
-        m.status = MatchStatus.LOCKED
-    s.commit()
-    return True, f"Ставка подарками на {val} ⭐️ (номинал) принята."
+    _add_bet(m, bet, bet.value_stars)
+    _done(s, commit)
+    return True, msg
 
-def resolve_match(s: Session, m: Match) -> Tuple[int, int, int, dict]:
+def place_bet(s: Session, m: Match, user: User, stake: Stake, commit: bool = True) -> Tuple[bool, str]:
+    if m.currency == Currency.STARS:
+        return place_bet_stars(s, m, user, int(stake), commit)
+    return place_bet_gifts(s, m, user, stake, commit)
+
+def gift_pools(s: Session, match_ids: List[int]) -> Dict[int, Dict[str, int]]:
     """
-    Возвращает: (winner_user_id, pool, commission_taken_stars, commission_detail)
-    commission_detail: {type: "stars"|"gift", "gift_code"?: str, "gift_value"?: int}
+    Общий пул подарков по матчам одним сгруппированным запросом: {match_id: {code: qty}}.
     """
-    if m.status not in (MatchStatus.LOCKED, MatchStatus.OPEN):
-        raise ValueError("Матч уже завершен/отменен.")
-    if len(m.bets) != 2:
-        raise ValueError("Для розыгрыша нужны 2 ставки.")
-
-    b1, b2 = m.bets
-    pool = b1.value_stars + b2.value_stars
-
-    # взвешенное случайное распределение шансов
-    weights = [b1.value_stars, b2.value_stars]
-    draw = random.random() * (weights[0] + weights[1])
-    winner_bet = b1 if draw < weights[0] else b2
-    loser_bet = b2 if winner_bet is b1 else b1
-    winner_user_id = winner_bet.user_id
+    pools: Dict[int, Dict[str, int]] = {mid: {} for mid in match_ids}
+    if not match_ids:
+        return pools
+    rows = (
+        s.query(Bet.match_id, BetGift.gift_id, func.sum(BetGift.qty))
+        .join(BetGift, BetGift.bet_id == Bet.id)
+        .filter(Bet.match_id.in_(match_ids))
+        .group_by(Bet.match_id, BetGift.gift_id)
+    )
+    for match_id, gift_id, qty in rows:
+        gift = gift_catalog.by_id(gift_id)
+        if gift:
+            pools[match_id][gift.code] = int(qty)
+    return pools
 
-    # комиссия
+def match_commission(s: Session, currency: Currency, pool: int, all_gifts: Dict[str, int]) -> Tuple[int, dict]:
+    """
+    Комиссия матча: (commission_stars, commission_detail). Общая для resolve_match и пакетного резолвера.
+    """
     commission_stars = int(pool * COMMISSION_PCT)
     commission_detail = {"type": "stars", "value": commission_stars}
 
-    if m.currency == Currency.GIFTS:
+    if currency == Currency.GIFTS:
         # при ставках подарками комиссия: 5% от пула ИЛИ самый дешёвый подарок из общего пула,
         # если его стоимость больше, чем 5% пула — тогда забираем подарок
-        # соберём общий пул подарков
-        all_gifts: Dict[str, int] = {}
-        for b in [b1, b2]:
-            if b.gifts_blob:
-                for code, qty in (item.split(":") for item in b.gifts_blob.split(",") if item):
-                    all_gifts[code] = all_gifts.get(code, 0) + int(qty)
         cheapest_code, cheapest_val = cheapest_gift_in_pool(s, all_gifts)
         if cheapest_code and cheapest_val > commission_stars:
             commission_detail = {"type": "gift", "gift_code": cheapest_code, "gift_value": cheapest_val}
             commission_stars = cheapest_val
+    return commission_stars, commission_detail
+
+def pick_winner(values: List[int], draw: float) -> Tuple[int, int]:
+    """
+    Взвешенный выбор: шанс ставки пропорционален её value. draw — случайное число из [0, 1).
+    Префиксные суммы + бинарный поиск: O(log n) на выбор после O(n) на суммы.
+    Возвращает (индекс победившей ставки, пул).
+    """
+    prefix = list(accumulate(values))
+    pool = prefix[-1]
+    return min(bisect_right(prefix, draw * pool), len(values) - 1), pool
+
+def match_events(match_id: int, user_ids: List[int], winner_user_id: int, pool: int, payout: int) -> List[tuple]:
+    # итог матча для живых обновлений мини-приложения (live.py)
+    return [(uid, {"type": "match", "match_id": match_id, "pool": pool,
+                   "outcome": "win" if uid == winner_user_id else "loss",
+                   "payout": payout if uid == winner_user_id else 0})
+            for uid in user_ids]
+
+def resolve_match(s: Session, m: Match, commit: bool = True) -> Tuple[int, int, int, dict]:
+    """
+    Возвращает: (winner_user_id, pool, commission_taken_stars, commission_detail)
+    commission_detail: {type: "stars"|"gift", "gift_code"?: str, "gift_value"?: int}
+    """
+    if m.status not in (MatchStatus.LOCKED, MatchStatus.OPEN):
+        raise ValueError("Матч уже завершен/отменен.")
+    bets = list(m.bets)
+    if len(bets) < 2:
+        raise ValueError("Для розыгрыша нужно хотя бы 2 ставки.")
+
+    # взвешенное случайное распределение шансов
+    winner_idx, pool = pick_winner([b.value_stars for b in bets], random.random())
+    winner_user_id = bets[winner_idx].user_id
+
+    # комиссия
+    all_gifts = gift_pools(s, [m.id])[m.id] if m.currency == Currency.GIFTS else {}
+    commission_stars, commission_detail = match_commission(s, m.currency, pool, all_gifts)
 
     payout = pool - commission_stars
     # начисляем победителю
-    winner = s.query(User).get(winner_user_id)
-    winner.stars_balance += payout
+    credit_stars(s, winner_user_id, payout, "payout", m.id)
+    record_results(s, match_deltas(
+        [(b.user_id, b.value_stars) for b in bets], winner_user_id, pool, commission_stars
+    ))
+    queue_events(s, match_events(m.id, [b.user_id for b in bets], winner_user_id, pool, payout))
 
     m.status = MatchStatus.RESOLVED
     m.winner_user_id = winner_user_id
     m.resolved_at = datetime.utcnow()
-    s.commit()
+    _done(s, commit)
     return winner_user_id, pool, commission_stars, commission_detail
 
-# --- антифрод (минимальный) ---
+def check_stake(s: Session, user: User, currency: Currency, stake: Stake) -> Tuple[bool, str, int]:
+    """
+    Проверка ставки без записи в БД (до постановки в очередь подбора).
+    Возвращает: (ok, error, value_stars). Окончательное списание — условным UPDATE в run_fight.
+    """
+    if currency == Currency.STARS:
+        amount = int(stake)
+        if amount <= 0:
+            return False, "Ставка должна быть больше нуля.", 0
+        if balance_of(s, user.id) < amount:
+            return False, "Недостаточно звёзд.", 0
+        return True, "", amount
+    if not stake:
+        return False, "Не указаны подарки.", 0
+    have = {
+        gift_id: qty for gift_id, qty in
+        s.query(InventoryItem.gift_id, InventoryItem.qty).filter_by(user_id=user.id)
+    }
+    for code, qty in stake.items():
+        if qty <= 0:
+            return False, "Кол-во подарков должно быть > 0.", 0
+        gift = gift_catalog.get(code)
+        if not gift:
+            return False, f"Подарок {code} не существует.", 0
+        if have.get(gift.id, 0) < qty:
+            return False, f"Недостаточно подарков {code}.", 0
+    return True, "", gifts_value(s, stake)
+
+def run_fight(s: Session, currency: Currency, entries: List[Tuple[User, Stake]],
+              resolve: bool = True, on_locked: Callable[[int], object] | None = None) -> Tuple[bool, str, dict]:
+    """
+    Бой целиком в одной транзакции: матч -> ставки участников -> розыгрыш -> один commit.
+    entries: [(user, stake)]. При ошибке любой ставки откатывается всё.
+    resolve=False — матч остаётся LOCKED для пакетного резолвера (resolver.py),
+    в result тогда только match_id и stakes. on_locked(match_id) вызывается до commit —
+    чтобы ждущий успел встать в очередь резолвера раньше, чем тот увидит матч.
+    Возвращает: (ok, error, result); при неудаче result = {"failed_user_id": ...}
+    """
+    try:
+        with phase("bets"):
+            m = create_match(s, currency, commit=False)
+            for user, stake in entries:
+                ok, msg = place_bet(s, m, user, stake, commit=False)
+                if not ok:
+                    s.rollback()
+                    return False, msg, {"failed_user_id": user.id}
+            stakes = {b.user_id: b.value_stars for b in m.bets}
+            match_id = m.id
+        if not resolve:
+            if on_locked:
+                on_locked(match_id)
+            with phase("commit"):
+                s.commit()
+            return True, "", {"match_id": match_id, "stakes": stakes}
+        with phase("resolve"):
+            winner_id, pool, commission, detail = resolve_match(s, m, commit=False)
+        with phase("commit"):
+            s.commit()
+    except Exception:
+        s.rollback()
+        raise
+    return True, "", {
+        "match_id": match_id, "winner_user_id": winner_id, "pool": pool,
+        "commission": commission, "detail": detail, "stakes": stakes,
+    }
+
+def bot_opponent(s: Session, user: User, currency: Currency, stake: Stake) -> Tuple[User, Stake]:
+    """
+    Бот-соперник: на звёзды ставит 80-120% ставки игрока, на подарки — 2 розы.
+    Средства боту выдаются в текущей транзакции.
+    """
+    bot_user = get_or_create_user(s, user.tg_id + 1, username=BOT_OPPONENT_USERNAME, commit=False)
+    if currency == Currency.STARS:
+        bot_amount = max(1, int(int(stake) * (0.8 + random.randint(0, 40) / 100)))
+        add_stars(s, bot_user, bot_amount, commit=False)  # чтобы точно хватило
+        return bot_user, bot_amount
+    inventory_delta(s, bot_user, "ROSE", 2, commit=False)  # выдать боту розы
+    return bot_user, {"ROSE": 2}
+
+def fight_with_bot(s: Session, user: User, currency: Currency, stake: Stake,
+                   resolve: bool = True, on_locked: Callable[[int], object] | None = None) -> Tuple[bool, str, dict]:
+    try:
+        with phase("opponent"):
+            bot_entry = bot_opponent(s, user, currency, stake)
+    except Exception:
+        s.rollback()
+        raise
+    return run_fight(s, currency, [(user, stake), bot_entry], resolve=resolve, on_locked=on_locked)
+
+# --- пакетный розыгрыш ---
 
-def can_start_match(s: Session, user: User) -> bool:
+def resolve_locked_batch(s: Session, limit: int = 500) -> Dict[int, dict]:
     """
-    Простейший лимитер: не больше 1 нового матча в 10 секунд.
+    Разыгрывает до limit LOCKED-матчей одной транзакцией: один SELECT матчей, один SELECT ставок,
+    все розыгрыши одним проходом, выплаты (проводки журнала) и смена статусов — executemany.
+    Правила комиссии те же, что в resolve_match (match_commission).
+    Битый матч (меньше двух ставок) отменяется с возвратом ставок в той же транзакции —
+    иначе он навсегда остался бы в начале выборки и занимал место в пачке.
+    Возвращает {match_id: {"winner_user_id", "pool", "commission", "detail"}}, для отменённых — {"canceled": True}.
     """
-    from models import Match, Bet
-    ten_sec_ago = datetime.utcnow() - timedelta(seconds=10)
-    recent = (
+    matches = (
+        s.query(Match.id, Match.currency)
+        .filter(Match.status == MatchStatus.LOCKED)
+        .order_by(Match.id)
+        .limit(limit)
+        .all()
+    )
+    if not matches:
+        return {}
+    currency_of = dict(matches)
+    bets_of: Dict[int, list] = {mid: [] for mid in currency_of}
+    for b in (
+        s.query(Bet.match_id, Bet.user_id, Bet.value_stars)
+        .filter(Bet.match_id.in_(currency_of))
+        .order_by(Bet.id)
+    ):
+        bets_of[b.match_id].append(b)
+    pools = gift_pools(s, [mid for mid, cur in currency_of.items() if cur == Currency.GIFTS])
+
+    draws = [random.random() for _ in currency_of]
+    results: Dict[int, dict] = {}
+    payouts: List[dict] = []
+    deltas: List[dict] = []
+    events: List[tuple] = []
+    for (mid, bets), draw in zip(bets_of.items(), draws):
+        if len(bets) < 2:
+            continue  # битый — отменим ниже
+        winner_idx, pool = pick_winner([b.value_stars for b in bets], draw)
+        winner_user_id = bets[winner_idx].user_id
+        commission, detail = match_commission(s, currency_of[mid], pool, pools.get(mid, {}))
+        payouts.append({"user_id": winner_user_id, "delta": pool - commission,
+                        "reason": "payout", "match_id": mid})
+        deltas += match_deltas([(b.user_id, b.value_stars) for b in bets], winner_user_id, pool, commission)
+        events += match_events(mid, [b.user_id for b in bets], winner_user_id, pool, pool - commission)
+        results[mid] = {"winner_user_id": winner_user_id, "pool": pool,
+                        "commission": commission, "detail": detail}
+    broken = [mid for mid, bets in bets_of.items() if len(bets) < 2]
+    if not results and not broken:
+        return {}
+
+    now = datetime.utcnow()
+    matches_t = Match.__table__
+    if results:
+        res = s.execute(
+            matches_t.update()
+            .where(matches_t.c.id == bindparam("mid"), matches_t.c.status == MatchStatus.LOCKED)
+            .values(status=MatchStatus.RESOLVED, winner_user_id=bindparam("winner"), resolved_at=now),
+            [{"mid": mid, "winner": r["winner_user_id"]} for mid, r in results.items()],
+        )
+        if res.rowcount != len(results):
+            # часть матчей уже разыграл кто-то другой — откатываемся, заберём на следующем проходе
+            s.rollback()
+            return {}
+    canceled: List[int] = []
+    if broken:
+        log.warning("resolver: матчи с меньше чем двумя ставками отменены: %s", broken)
+        canceled = s.execute(
+            update(Match).where(Match.id.in_(broken), Match.status == MatchStatus.LOCKED)
+            .values(status=MatchStatus.CANCELED, resolved_at=now)
+            .returning(Match.id)
+            .execution_options(synchronize_session=False)
+        ).scalars().all()
+        _refund_bets(s, canceled)
+    post_entries(s, payouts)
+    record_results(s, deltas)
+    queue_events(s, events)
+    s.commit()
+    results.update({mid: {"canceled": True} for mid in canceled})
+    return results
+
+def settled_results(s: Session, match_ids: List[int]) -> Dict[int, dict]:
+    """
+    Итоги уже разыгранных/отменённых матчей из БД в формате resolve_locked_batch
+    ({"canceled": True} для отменённых). Для ждущих, чей матч разыграл резолвер другого процесса
+    или проход, начавшийся до их submit. Комиссия пересчитывается по тем же правилам (match_commission).
+    """
+    rows = (
+        s.query(Match.id, Match.status, Match.currency, Match.winner_user_id, Match.total_value_stars)
+        .filter(Match.id.in_(match_ids), Match.status.in_([MatchStatus.RESOLVED, MatchStatus.CANCELED]))
+        .all()
+    )
+    pools = gift_pools(s, [r.id for r in rows if r.currency == Currency.GIFTS and r.status == MatchStatus.RESOLVED])
+    out: Dict[int, dict] = {}
+    for r in rows:
+        if r.status == MatchStatus.CANCELED:
+            out[r.id] = {"canceled": True}
+            continue
+        commission, detail = match_commission(s, r.currency, r.total_value_stars, pools.get(r.id, {}))
+        out[r.id] = {"winner_user_id": r.winner_user_id, "pool": r.total_value_stars,
+                     "commission": commission, "detail": detail}
+    return out
+
+# --- общий пул на N игроков ---
+
+POOL_CLOSED = "Пул уже закрыт."
+
+def open_pool(s: Session, currency: Currency, commit: bool = True) -> Match:
+    """
+    Текущий открытый пул по валюте или новый: POOL_MAX_PLAYERS мест, закрытие через POOL_LOCK_SECONDS.
+    Пулы отличаются от дуэлей заданным lock_at.
+    """
+    cfg = get_config()
+    now = datetime.utcnow()
+    m = (
         s.query(Match)
-        .join(Bet, Bet.match_id == Match.id)
-        .filter(Bet.user_id == user.id, Match.created_at >= ten_sec_ago)
-        .count()
+        .filter(Match.status == MatchStatus.OPEN, Match.lock_at > now + timedelta(seconds=1),
+                Match.currency == currency)
+        .order_by(Match.id.desc())
+        .first()
     )
-    return recent == 0
+    if m is None:
+        m = create_match(s, currency, commit, max_players=cfg.POOL_MAX_PLAYERS,
+                         lock_at=now + timedelta(seconds=cfg.POOL_LOCK_SECONDS))
+    return m
+
+def join_pool(s: Session, match_id: int, user: User, stake: Stake, commit: bool = True) -> Tuple[bool, str]:
+    """
+    Ставка в пул. Участники заходят параллельно из разных запросов, поэтому матч в ORM не читаем:
+    счётчик ставок, сумма пула и блокировка по max_players меняются одним условным UPDATE.
+    При commit=False в случае ошибки откатывает вызывающий.
+    """
+    currency = s.execute(select(Match.currency).where(Match.id == match_id)).scalar_one_or_none()
+    if currency is None:
+        return False, "Пул не найден."
+    if currency == Currency.STARS:
+        ok, msg, bet = _stars_bet(s, match_id, user, int(stake))
+    else:
+        ok, msg, bet = _gifts_bet(s, match_id, user, stake, commit)
+    if not ok:
+        if commit:
+            s.rollback()
+        return False, msg
+    now = datetime.utcnow()
+    res = s.execute(
+        update(Match)
+        .where(Match.id == match_id, Match.status == MatchStatus.OPEN,
+               Match.bets_count < Match.max_players,
+               or_(Match.lock_at.is_(None), Match.lock_at > now))
+        .values(
+            bets_count=Match.bets_count + 1,
+            total_value_stars=Match.total_value_stars + bet.value_stars,
+            status=case(
+                (Match.bets_count + 1 >= Match.max_players, literal(MatchStatus.LOCKED, Match.status.type)),
+                else_=literal(MatchStatus.OPEN, Match.status.type),
+            ),
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if res.rowcount != 1:
+        if commit:
+            s.rollback()
+        return False, POOL_CLOSED
+    s.add(bet)
+    try:
+        s.flush()
+    except IntegrityError:
+        if commit:
+            s.rollback()
+        return False, "Вы уже участвуете в этом пуле."
+    _done(s, commit)
+    return True, msg
+
+def enter_pool(s: Session, currency: Currency, user: User, stake: Stake) -> Tuple[bool, str, dict]:
+    """
+    Ставка в текущий пул валюты. Пул мог заполниться между выбором и ставкой — тогда берём следующий.
+    Возвращает (ok, msg, {"match_id", "lock_at"}).
+    """
+    for _ in range(3):
+        m = open_pool(s, currency)
+        match_id, lock_at = m.id, m.lock_at
+        ok, msg = join_pool(s, match_id, user, stake)
+        if ok or msg != POOL_CLOSED:
+            return ok, msg, {"match_id": match_id, "lock_at": lock_at}
+    return False, msg, {}
+
+def lock_due_pools(s: Session) -> List[int]:
+    """
+    Закрывает пулы с истёкшим lock_at: от двух ставок — LOCKED (разыграет resolve_locked_batch),
+    иначе — CANCELED с возвратом ставки. Одна транзакция. Возвращает id отменённых пулов.
+    """
+    now = datetime.utcnow()
+    due = (Match.status == MatchStatus.OPEN) & (Match.lock_at <= now)
+    # резолвер зовёт это каждый проход — без закрываемых пулов обходимся чтением по индексу
+    if s.query(Match.id).filter(due).first() is None:
+        return []
+    s.execute(
+        update(Match).where(due, Match.bets_count >= 2)
+        .values(status=MatchStatus.LOCKED)
+        .execution_options(synchronize_session=False)
+    )
+    canceled = s.execute(
+        update(Match).where(due, Match.bets_count < 2)
+        .values(status=MatchStatus.CANCELED, resolved_at=now)
+        .returning(Match.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    _refund_bets(s, canceled)
+    s.commit()
+    return canceled
+
+def _refund_bets(s: Session, match_ids: List[int]):
+    # возврат ставок отменённых матчей в текущей транзакции: звёзды — проводками, подарки — в инвентарь
+    if not match_ids:
+        return
+    refunds, events = [], []
+    for bet in s.query(Bet).filter(Bet.match_id.in_(match_ids)):
+        events.append((bet.user_id, {"type": "match", "match_id": bet.match_id, "outcome": "canceled"}))
+        if bet.amount_stars:
+            refunds.append({"user_id": bet.user_id, "delta": bet.amount_stars,
+                            "reason": "refund", "match_id": bet.match_id})
+        for bg in bet.gifts:
+            gift = gift_catalog.by_id(bg.gift_id)
+            if gift:
+                inventory_delta(s, s.get(User, bet.user_id), gift.code, bg.qty, commit=False)
+    post_entries(s, refunds)
+    queue_events(s, events)
@@ -0,0 +1,254 @@
+# matchmaking.py
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Tuple
+from sqlalchemy.orm import Session
+from models import Currency, SessionLocal, User
+from logic import Stake, run_fight, fight_with_bot
+from resolver import resolver
+from metrics import phase
+from config import get_config
+
+_cfg = get_config()
+
+WAITING, PAIRED, CANCELED, EXPIRED = "waiting", "paired", "canceled", "expired"
+
+# результат боя в формате run_fight: (ok, error, result)
+FightResult = Tuple[bool, str, dict]
+
+
+@dataclass(eq=False)
+class Ticket:
+    user_id: int
+    currency: Currency
+    stake: Stake
+    value: int  # номинал ставки в звёздах
+    created_at: float = field(default_factory=time.monotonic)
+    state: str = WAITING
+    future: Future = field(default_factory=Future)
+
+
+class Matchmaker:
+    """
+    Подбор соперников в памяти процесса.
+    Заявки лежат в кучах по (валюта, корзина номинала); корзины логарифмические шириной (1 + tolerance),
+    поэтому совместимые ставки (большая не больше меньшей * (1 + tolerance)) лежат в своей или соседней
+    корзине, и подбор стоит O(log n). В своей корзине совместимы все; из соседней берём самую старую,
+    только если она совместима, — более новую совместимую за несовместимой не ищем, заявка тогда
+    подождёт следующей. В БД пишем только когда пара сложилась (settle).
+    Отменённые и протухшие заявки удаляются из куч лениво.
+    """
+
+    def __init__(self, settle: Callable[[Ticket, Ticket], FightResult],
+                 tolerance: float = 0.25, wait_seconds: float = 3.0):
+        self._settle = settle
+        self.tolerance = tolerance
+        self._log_base = math.log1p(tolerance)
+        self.wait_seconds = wait_seconds
+        self._lock = threading.Lock()
+        self._heaps: Dict[Tuple[Currency, int], List[tuple]] = {}
+        self._active: Dict[int, Ticket] = {}  # user_id -> ожидающая заявка
+        self._seq = itertools.count()
+        self._last_sweep = time.monotonic()
+
+    def _bucket(self, value: int) -> int:
+        return int(math.log(max(value, 1)) / self._log_base)
+
+    def _compatible(self, a: int, b: int) -> bool:
+        return max(a, b) <= min(a, b) * (1 + self.tolerance)
+
+    def _pop_candidate(self, t: Ticket, now: float) -> Ticket | None:
+        # самая старая живая совместимая заявка из своей и соседних корзин
+        best_key, best_head = None, None
+        b = self._bucket(t.value)
+        for key in ((t.currency, b), (t.currency, b - 1), (t.currency, b + 1)):
+            heap = self._heaps.get(key)
+            while heap:
+                other = heap[0][2]
+                if other.state == WAITING and now - other.created_at < self.wait_seconds:
+                    break
+                heapq.heappop(heap)
+                self._expire(other)
+            if not heap:
+                self._heaps.pop(key, None)
+                continue
+            if not self._compatible(t.value, heap[0][2].value):
+                continue
+            if best_head is None or heap[0] < best_head:
+                best_key, best_head = key, heap[0]
+        if best_key is None:
+            return None
+        heapq.heappop(self._heaps[best_key])
+        return best_head[2]
+
+    def submit(self, t: Ticket) -> bool:
+        """
+        Ставит заявку в очередь или сразу сводит её с подходящей.
+        False — у пользователя уже есть ожидающая заявка.
+        """
+        with self._lock:
+            if t.user_id in self._active:
+                return False
+            pair = self._match_or_enqueue(t)
+        if pair:
+            self._run_settle(*pair)
+        return True
+
+    def _match_or_enqueue(self, t: Ticket) -> Tuple[Ticket, Ticket] | None:
+        now = time.monotonic()
+        if now - self._last_sweep > self.wait_seconds:
+            self._sweep(now)
+        other = self._pop_candidate(t, now)
+        if other is None:
+            t.state = WAITING
+            self._active[t.user_id] = t
+            key = (t.currency, self._bucket(t.value))
+            heapq.heappush(self._heaps.setdefault(key, []), (t.created_at, next(self._seq), t))
+            return None
+        other.state = t.state = PAIRED
+        self._active.pop(other.user_id, None)
+        self._active.pop(t.user_id, None)
+        return other, t
+
+    def _run_settle(self, a: Ticket, b: Ticket):
+        try:
+            ok, msg, res = self._settle(a, b)
+        except Exception as e:
+            for t in (a, b):
+                t.future.set_exception(e)
+            return
+        if ok:
+            for t in (a, b):
+                t.future.set_result((ok, msg, res))
+            return
+        # не хватило средств у одного из игроков: ему — ошибка, второго возвращаем в очередь
+        failed = res.get("failed_user_id")
+        requeue = []
+        for t in (a, b):
+            if failed is None or t.user_id == failed:
+                t.future.set_result((ok, msg, res))
+            else:
+                requeue.append(t)
+        for t in requeue:
+            with self._lock:
+                pair = self._match_or_enqueue(t)
+            if pair:
+                self._run_settle(*pair)
+
+    def _expire(self, t: Ticket):
+        # протухшую заявку больше не сводим; её владелец по таймауту уйдёт в фолбэк
+        if t.state == WAITING:
+            t.state = EXPIRED
+            self._active.pop(t.user_id, None)
+
+    def cancel(self, t: Ticket) -> bool:
+        """
+        True — заявка снята (её можно играть с ботом); False — пара уже сложилась.
+        """
+        with self._lock:
+            if t.state not in (WAITING, EXPIRED):
+                return False
+            t.state = CANCELED
+            self._active.pop(t.user_id, None)
+            return True
+
+    def _sweep(self, now: float):
+        # выкидываем из куч снятые и протухшие заявки
+        for key in list(self._heaps):
+            alive = []
+            for item in self._heaps[key]:
+                t = item[2]
+                if now - t.created_at >= self.wait_seconds:
+                    self._expire(t)
+                if t.state == WAITING:
+                    alive.append(item)
+            if alive:
+                heapq.heapify(alive)
+                self._heaps[key] = alive
+            else:
+                del self._heaps[key]
+        self._last_sweep = now
+
+    def waiting_count(self) -> int:
+        with self._lock:
+            return len(self._active)
+
+
+def _locked_fight(fight: Callable[..., FightResult], *args) -> FightResult:
+    """
+    fight — run_fight или fight_with_bot. В режиме RESOLVER_BATCH матч записывается LOCKED,
+    и ждущий встаёт в очередь резолвера ещё до commit: проход, случившийся сразу после commit,
+    не разминётся с ним.
+    """
+    if not _cfg.RESOLVER_BATCH:
+        return fight(*args)
+    locked: List[int] = []
+
+    def on_locked(match_id: int):
+        locked.append(match_id)
+        resolver.submit(match_id)
+
+    try:
+        ok, msg, res = fight(*args, resolve=False, on_locked=on_locked)
+    except Exception:
+        for mid in locked:
+            resolver.discard(mid)
+        raise
+    if ok:
+        with phase("batch_resolve"):
+            res.update(resolver.result(res["match_id"], timeout=_cfg.MATCH_WAIT_SECONDS + 10))
+    return ok, msg, res
+
+
+def settle_pair(a: Ticket, b: Ticket) -> FightResult:
+    s = SessionLocal()
+    try:
+        entries = [(s.get(User, t.user_id), t.stake) for t in (a, b)]
+        return _locked_fight(run_fight, s, a.currency, entries)
+    finally:
+        s.close()
+
+
+def fight_bot_fallback(s: Session, t: Ticket) -> FightResult:
+    return _locked_fight(fight_with_bot, s, s.get(User, t.user_id), t.currency, t.stake)
+
+
+def wait_result(mm: Matchmaker, t: Ticket) -> FightResult:
+    """
+    Ждёт соперника не дольше mm.wait_seconds, затем играет с ботом.
+    """
+    try:
+        with phase("matchmaking"):
+            return t.future.result(timeout=mm.wait_seconds)
+    except FutureTimeout:
+        if not mm.cancel(t):
+            return t.future.result()
+    s = SessionLocal()
+    try:
+        return fight_bot_fallback(s, t)
+    finally:
+        s.close()
+
+
+async def wait_result_async(mm: Matchmaker, t: Ticket) -> FightResult | None:
+    """
+    Асинхронный вариант для бота. None — соперника нет, заявка снята: нужен бой с ботом
+    (его DB-часть вызывающий запускает через run_db).
+    """
+    fut = asyncio.wrap_future(t.future)
+    try:
+        with phase("matchmaking"):
+            return await asyncio.wait_for(asyncio.shield(fut), timeout=mm.wait_seconds)
+    except asyncio.TimeoutError:
+        if mm.cancel(t):
+            return None
+        return await fut
+
+
+matchmaker = Matchmaker(settle_pair, tolerance=_cfg.MATCH_TOLERANCE, wait_seconds=_cfg.MATCH_WAIT_SECONDS)
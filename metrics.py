@@ -0,0 +1,208 @@
+# metrics.py
+import bisect
+import contextvars
+import functools
+import logging
+import os
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from typing import Dict, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from config import get_config
+
+log = logging.getLogger("pvp.sql")
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# откуда пришла текущая работа: "web:<endpoint>", "bot:<command>" или "background"
+current_route: contextvars.ContextVar[str] = contextvars.ContextVar("current_route", default="background")
+
+
+class Counter:
+    def __init__(self, name: str, help_: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help, self.labels = name, help_, labels
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self, const: dict) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for lv, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, lv, const)} {v}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_: str, labels: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help_, labels, tuple(buckets)
+        self._lock = threading.Lock()
+        self._series: Dict[tuple, list] = {}  # labels -> [counts по корзинам..., sum, count]
+
+    def observe(self, value: float, *label_values):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, *label_values)
+
+    def render(self, const: dict) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for lv, series in sorted(self._series.items()):
+                cumulative = 0
+                for le, n in zip(self.buckets, series):
+                    cumulative += n
+                    lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), lv + (str(le),), const)} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(self.labels + ('le',), lv + ('+Inf',), const)} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labels, lv, const)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labels, lv, const)} {series[-1]}")
+        return lines
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, const: dict | None = None) -> str:
+    pairs = list((const or {}).items()) + list(zip(names, values))
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+
+REQUESTS = Histogram("pvp_request_seconds", "Время обработки запроса/команды", ("route",))
+SQL_QUERIES = Counter("pvp_sql_queries_total", "SQL-запросов", ("route",))
+SQL_SECONDS = Histogram("pvp_sql_query_seconds", "Время SQL-запроса", ("route",))
+COMMITS = Histogram("pvp_commit_seconds", "Время commit сессии (с flush)", ("route",))
+FIGHT_PHASES = Histogram("pvp_fight_phase_seconds", "Фазы боя", ("phase",))
+ERRORS = Counter("pvp_errors_total", "Необработанные ошибки", ("route",))
+WEBHOOK_UPDATES = Counter("pvp_webhook_updates_total", "Апдейты, пришедшие вебхуком", ("result",))
+
+_instrumented_engines = weakref.WeakSet()
+
+REGISTRY = [REQUESTS, SQL_QUERIES, SQL_SECONDS, COMMITS, FIGHT_PHASES, ERRORS, WEBHOOK_UPDATES]
+
+
+def render() -> str:
+    """
+    Счётчики живут в памяти процесса. Под gunicorn /metrics отвечает случайный воркер,
+    поэтому у каждой серии метка pid: серии воркеров не смешиваются и не идут назад,
+    а общие значения — sum без pid (sum by (route) (rate(...))).
+    """
+    const = {"pid": os.getpid()}
+    lines = []
+    for m in REGISTRY:
+        lines += m.render(const)
+    return "\n".join(lines) + "\n"
+
+
+def phase(name: str):
+    """
+    with phase("bet"): ... — время фазы боя в pvp_fight_phase_seconds.
+    """
+    return FIGHT_PHASES.time(name)
+
+
+# --- SQLAlchemy ---
+
+def instrument_engine(engine, slow_query_ms: int | None = None):
+    """
+    Считает запросы и их время по текущему маршруту; запросы дольше slow_query_ms пишет в лог.
+    Повторный вызов для того же engine ничего не делает (web и bot в одном процессе).
+    """
+    if engine in _instrumented_engines:
+        return
+    _instrumented_engines.add(engine)
+    if slow_query_ms is None:
+        slow_query_ms = get_config().SLOW_QUERY_MS
+    slow = slow_query_ms / 1000 if slow_query_ms > 0 else None
+
+    # начало запроса храним в его контексте выполнения, а не в стеке на соединении:
+    # упавший запрос не доходит до after_cursor_execute и ничего после себя не оставляет
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        route = current_route.get()
+        SQL_QUERIES.inc(route)
+        SQL_SECONDS.observe(elapsed, route)
+        if slow is not None and elapsed >= slow:
+            log.warning("slow query %.1f ms [%s]: %s", elapsed * 1000, route, statement)
+
+
+@event.listens_for(Session, "before_commit")
+def _commit_start(s: Session):
+    s.info["commit_start"] = time.perf_counter()
+
+
+@event.listens_for(Session, "after_commit")
+def _commit_end(s: Session):
+    t0 = s.info.pop("commit_start", None)
+    if t0 is not None:
+        COMMITS.observe(time.perf_counter() - t0, current_route.get())
+
+
+# --- Flask и бот ---
+
+def instrument_flask(app):
+    from flask import g, request
+
+    @app.before_request
+    def _start():
+        g.metrics_token = current_route.set(f"web:{request.endpoint or 'unknown'}")
+        g.metrics_t0 = time.perf_counter()
+
+    @app.teardown_request
+    def _finish(exc):
+        token = g.pop("metrics_token", None)
+        if token is None:
+            return
+        route = current_route.get()
+        REQUESTS.observe(time.perf_counter() - g.pop("metrics_t0"), route)
+        if exc is not None:
+            ERRORS.inc(route)
+        current_route.reset(token)
+
+
+def instrumented_command(name: str):
+    """
+    Декоратор хэндлера бота: маршрут bot:<name> для SQL-метрик и время команды.
+    run_db переносит контекст в пул потоков, так что запросы тоже попадают под bot:<name>.
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            token = current_route.set(f"bot:{name}")
+            t0 = time.perf_counter()
+            try:
+                return await handler(update, context)
+            except Exception:
+                ERRORS.inc(f"bot:{name}")
+                raise
+            finally:
+                REQUESTS.observe(time.perf_counter() - t0, f"bot:{name}")
+                current_route.reset(token)
+        return wrapper
+    return decorator
@@ -0,0 +1,32 @@
+# migrations/env.py
+from alembic import context
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from models import Base, engine  # noqa: E402
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    context.configure(
+        url=str(engine.url), target_metadata=target_metadata,
+        literal_binds=True, render_as_batch=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    with engine.connect() as connection:
+        # render_as_batch: SQLite не умеет ALTER большинства вещей, alembic пересоздаёт таблицу
+        context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,74 @@
+"""bet_gifts: подарки ставки отдельными строками вместо gifts_blob
+
+Базовая схема создаётся init_db (create_all), поэтому миграции проверяют,
+что уже есть в базе: на свежей базе таблица bet_gifts уже создана и переносить нечего.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+BATCH = 1000
+
+
+def upgrade():
+    bind = op.get_bind()
+    if "bet_gifts" not in sa.inspect(bind).get_table_names():
+        op.create_table(
+            "bet_gifts",
+            sa.Column("bet_id", sa.Integer, sa.ForeignKey("bets.id", ondelete="CASCADE"), primary_key=True),
+            sa.Column("gift_id", sa.Integer, sa.ForeignKey("gifts.id"), primary_key=True),
+            sa.Column("qty", sa.Integer, nullable=False),
+        )
+
+    gift_ids = dict(bind.execute(sa.text("SELECT code, id FROM gifts")).all())
+    select = sa.text(
+        "SELECT id, gifts_blob FROM bets "
+        "WHERE id > :last AND gifts_blob IS NOT NULL AND gifts_blob != '' "
+        "AND id NOT IN (SELECT bet_id FROM bet_gifts) "
+        "ORDER BY id LIMIT :limit"
+    )
+    insert = sa.text("INSERT INTO bet_gifts (bet_id, gift_id, qty) VALUES (:bet_id, :gift_id, :qty)")
+    last = 0
+    while True:
+        chunk = bind.execute(select, {"last": last, "limit": BATCH}).all()
+        if not chunk:
+            break
+        last = chunk[-1][0]
+        params = []
+        for bet_id, blob in chunk:
+            qty_by_gift = {}
+            for item in (p.strip() for p in blob.split(",") if p.strip()):
+                code, qty = item.split(":")
+                gift_id = gift_ids.get(code.strip().upper())
+                if gift_id is not None:
+                    qty_by_gift[gift_id] = qty_by_gift.get(gift_id, 0) + int(qty)
+            params += [{"bet_id": bet_id, "gift_id": g, "qty": q} for g, q in qty_by_gift.items()]
+        if params:
+            bind.execute(insert, params)
+
+
+def downgrade():
+    bind = op.get_bind()
+    # восстанавливаем gifts_blob для ставок, сделанных уже после миграции
+    rows = bind.execute(sa.text(
+        "SELECT bg.bet_id, g.code, bg.qty FROM bet_gifts bg "
+        "JOIN gifts g ON g.id = bg.gift_id JOIN bets b ON b.id = bg.bet_id "
+        "WHERE b.gifts_blob IS NULL ORDER BY bg.bet_id"
+    )).all()
+    blobs = {}
+    for bet_id, code, qty in rows:
+        blobs.setdefault(bet_id, []).append(f"{code}:{qty}")
+    if blobs:
+        bind.execute(
+            sa.text("UPDATE bets SET gifts_blob = :blob WHERE id = :id"),
+            [{"id": bet_id, "blob": ",".join(items)} for bet_id, items in blobs.items()],
+        )
+    op.drop_table("bet_gifts")
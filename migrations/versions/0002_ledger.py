@@ -0,0 +1,50 @@
+"""ledger_entries и ledger_snapshots: журнал проводок по балансу
+
+Текущие users.stars_balance становятся снимком с отметкой 0 — пересчёт не нужен.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    tables = sa.inspect(op.get_bind()).get_table_names()
+    if "ledger_entries" not in tables:
+        op.create_table(
+            "ledger_entries",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=True),
+            sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+            sa.Column("delta", sa.Integer, nullable=False),
+            sa.Column("reason", sa.String(32), nullable=False),
+            sa.Column("match_id", sa.Integer, nullable=True),
+            sa.Column("created_at", sa.DateTime, nullable=False),
+        )
+        op.create_index("ix_ledger_user_id", "ledger_entries", ["user_id", "id"])
+    if "ledger_snapshots" not in tables:
+        op.create_table(
+            "ledger_snapshots",
+            sa.Column("id", sa.Integer, primary_key=True),
+            sa.Column("last_entry_id", sa.Integer, nullable=False),
+            sa.Column("folded_at", sa.DateTime, nullable=False),
+        )
+
+
+def downgrade():
+    # перед откатом сворачиваем проводки в users.stars_balance, иначе они потеряются
+    bind = op.get_bind()
+    bind.execute(sa.text(
+        "UPDATE users SET stars_balance = stars_balance + ("
+        "  SELECT COALESCE(SUM(e.delta), 0) FROM ledger_entries e WHERE e.user_id = users.id"
+        "  AND e.id > COALESCE((SELECT MAX(last_entry_id) FROM ledger_snapshots), 0))"
+    ))
+    op.drop_table("ledger_snapshots")
+    op.drop_index("ix_ledger_user_id", table_name="ledger_entries")
+    op.drop_table("ledger_entries")
@@ -0,0 +1,42 @@
+"""matches.max_players, lock_at, bets_count: матчи на N игроков (общий пул)
+
+Существующие матчи — дуэли: max_players = 2, bets_count пересчитывается по bets.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    bind = op.get_bind()
+    insp = sa.inspect(bind)
+    columns = {c["name"] for c in insp.get_columns("matches")}
+    with op.batch_alter_table("matches") as batch:
+        if "max_players" not in columns:
+            batch.add_column(sa.Column("max_players", sa.Integer, nullable=False, server_default="2"))
+        if "lock_at" not in columns:
+            batch.add_column(sa.Column("lock_at", sa.DateTime, nullable=True))
+        if "bets_count" not in columns:
+            batch.add_column(sa.Column("bets_count", sa.Integer, nullable=False, server_default="0"))
+    if "bets_count" not in columns:
+        bind.execute(sa.text(
+            "UPDATE matches SET bets_count = (SELECT COUNT(*) FROM bets WHERE bets.match_id = matches.id)"
+        ))
+    if "ix_matches_status_lock_at" not in {i["name"] for i in insp.get_indexes("matches")}:
+        op.create_index("ix_matches_status_lock_at", "matches", ["status", "lock_at"])
+
+
+def downgrade():
+    op.drop_index("ix_matches_status_lock_at", table_name="matches")
+    with op.batch_alter_table("matches") as batch:
+        batch.drop_column("bets_count")
+        batch.drop_column("lock_at")
+        batch.drop_column("max_players")
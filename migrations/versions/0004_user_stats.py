@@ -0,0 +1,36 @@
+"""user_stats: агрегаты игрока для статистики и рейтингов
+
+Таблица создаётся пустой; заполнить по истории — python stats.py rebuild.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if "user_stats" in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table(
+        "user_stats",
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
+        sa.Column("wins", sa.Integer, nullable=False),
+        sa.Column("losses", sa.Integer, nullable=False),
+        sa.Column("volume", sa.Integer, nullable=False),
+        sa.Column("net", sa.Integer, nullable=False),
+        sa.Column("commission", sa.Integer, nullable=False),
+    )
+    op.create_index("ix_user_stats_wins", "user_stats", ["wins"])
+    op.create_index("ix_user_stats_volume", "user_stats", ["volume"])
+    op.create_index("ix_user_stats_net", "user_stats", ["net"])
+
+
+def downgrade():
+    op.drop_table("user_stats")
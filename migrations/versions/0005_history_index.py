@@ -0,0 +1,22 @@
+"""bets(user_id, created_at, match_id): индекс для истории матчей игрока
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if "ix_bets_user_created" not in {i["name"] for i in sa.inspect(op.get_bind()).get_indexes("bets")}:
+        op.create_index("ix_bets_user_created", "bets", ["user_id", "created_at", "match_id"])
+
+
+def downgrade():
+    op.drop_index("ix_bets_user_created", table_name="bets")
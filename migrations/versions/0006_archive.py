@@ -0,0 +1,67 @@
+"""matches_archive, bets_archive, bet_gifts_archive: архив завершённых матчей (archive.py)
+
+Плюс matches(status, created_at) — по нему архиватор выбирает старые завершённые матчи.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+# типы уже созданы вместе с matches; на PostgreSQL второй раз их не создаём
+match_status = postgresql.ENUM("OPEN", "LOCKED", "RESOLVED", "CANCELED", name="matchstatus", create_type=False)
+currency = postgresql.ENUM("STARS", "GIFTS", name="currency", create_type=False)
+
+
+def upgrade():
+    insp = sa.inspect(op.get_bind())
+    tables = set(insp.get_table_names())
+    if "ix_matches_status_created" not in {i["name"] for i in insp.get_indexes("matches")}:
+        op.create_index("ix_matches_status_created", "matches", ["status", "created_at"])
+    if "matches_archive" not in tables:
+        op.create_table(
+            "matches_archive",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=False),
+            sa.Column("status", match_status, nullable=False),
+            sa.Column("currency", currency, nullable=False),
+            sa.Column("created_at", sa.DateTime, nullable=False),
+            sa.Column("resolved_at", sa.DateTime, nullable=True),
+            sa.Column("winner_user_id", sa.Integer, nullable=True),
+            sa.Column("total_value_stars", sa.Integer, nullable=False),
+            sa.Column("max_players", sa.Integer, nullable=False),
+            sa.Column("lock_at", sa.DateTime, nullable=True),
+            sa.Column("bets_count", sa.Integer, nullable=False),
+        )
+    if "bets_archive" not in tables:
+        op.create_table(
+            "bets_archive",
+            sa.Column("id", sa.Integer, primary_key=True, autoincrement=False),
+            sa.Column("match_id", sa.Integer, nullable=False),
+            sa.Column("user_id", sa.Integer, nullable=False),
+            sa.Column("amount_stars", sa.Integer, nullable=False),
+            sa.Column("value_stars", sa.Integer, nullable=False),
+            sa.Column("created_at", sa.DateTime, nullable=False),
+        )
+        op.create_index("ix_bets_archive_user_created", "bets_archive", ["user_id", "created_at", "match_id"])
+        op.create_index("ix_bets_archive_match", "bets_archive", ["match_id"])
+    if "bet_gifts_archive" not in tables:
+        op.create_table(
+            "bet_gifts_archive",
+            sa.Column("bet_id", sa.Integer, primary_key=True),
+            sa.Column("gift_id", sa.Integer, primary_key=True),
+            sa.Column("qty", sa.Integer, nullable=False),
+        )
+
+
+def downgrade():
+    op.drop_table("bet_gifts_archive")
+    op.drop_table("bets_archive")
+    op.drop_table("matches_archive")
+    op.drop_index("ix_matches_status_created", table_name="matches")
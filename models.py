@@ -1,14 +1,14 @@
 # models.py
 from datetime import datetime
 from sqlalchemy import (
-    String, Integer, BigInteger, DateTime, Boolean, ForeignKey, Enum, UniqueConstraint,
+    String, Integer, BigInteger, DateTime, Boolean, ForeignKey, Enum, Index, UniqueConstraint,
     func
 )
 from sqlalchemy.orm import declarative_base, Mapped, mapped_column, relationship
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 import enum
-import os
+from config import get_config
 
 Base = declarative_base()
 
@@ -22,11 +22,15 @@ class MatchStatus(enum.Enum):
     RESOLVED = "resolved"
     CANCELED = "canceled"
 
+# имя пользователя бота-соперника (logic.bot_opponent); в рейтинги не попадает
+BOT_OPPONENT_USERNAME = "BotOpponent"
+
 class User(Base):
     __tablename__ = "users"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     tg_id: Mapped[int] = mapped_column(BigInteger, index=True, unique=True)
     username: Mapped[str | None] = mapped_column(String(64), nullable=True)
+    # снимок баланса; актуальный баланс = снимок + проводки ledger_entries после отметки (ledger.balance_of)
     stars_balance: Mapped[int] = mapped_column(Integer, default=0)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
@@ -62,31 +66,185 @@ class Match(Base):
     winner_user_id: Mapped[int | None] = mapped_column(ForeignKey("users.id"), nullable=True)
     # для контроля ставок
     total_value_stars: Mapped[int] = mapped_column(Integer, default=0)  # pool в звёздах (включая gifts, конвертированные по номиналу)
+    # сколько ставок принимает матч: 2 — дуэль, больше — общий пул; lock_at — когда пул закрывается по времени
+    max_players: Mapped[int] = mapped_column(Integer, default=2, server_default="2")
+    lock_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    bets_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
 
     bets: Mapped[list["Bet"]] = relationship("Bet", back_populates="match", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_matches_status_lock_at", "status", "lock_at"),
+        # архиватор: завершённые матчи старше порога
+        Index("ix_matches_status_created", "status", "created_at"),
+    )
+
 class Bet(Base):
     __tablename__ = "bets"
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     match_id: Mapped[int] = mapped_column(ForeignKey("matches.id", ondelete="CASCADE"))
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
     amount_stars: Mapped[int] = mapped_column(Integer, default=0)  # если звёздами
-    # если подарками — храним JSON-подобно упрощённо: "ROSE:2,BOX:1"
+    # устаревшее: подарки ставки строкой "ROSE:2,BOX:1"; теперь — строки bet_gifts,
+    # колонка оставлена только для отката миграции 0001
     gifts_blob: Mapped[str | None] = mapped_column(String(512), nullable=True)
     value_stars: Mapped[int] = mapped_column(Integer, default=0)  # пересчитанное значение ставки в звёздах
 
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
     user: Mapped[User] = relationship("User", back_populates="bets")
     match: Mapped[Match] = relationship("Match", back_populates="bets")
-    __table_args__ = (UniqueConstraint("match_id", "user_id", name="uix_match_user"),)
+    gifts: Mapped[list["BetGift"]] = relationship("BetGift", back_populates="bet", cascade="all, delete-orphan")
+    __table_args__ = (
+        UniqueConstraint("match_id", "user_id", name="uix_match_user"),
+        # история игрока (history.py): WHERE user_id = ? ORDER BY created_at DESC, match_id DESC
+        Index("ix_bets_user_created", "user_id", "created_at", "match_id"),
+    )
+
+class BetGift(Base):
+    __tablename__ = "bet_gifts"
+    bet_id: Mapped[int] = mapped_column(ForeignKey("bets.id", ondelete="CASCADE"), primary_key=True)
+    gift_id: Mapped[int] = mapped_column(ForeignKey("gifts.id"), primary_key=True)
+    qty: Mapped[int] = mapped_column(Integer)
+
+    bet: Mapped[Bet] = relationship("Bet", back_populates="gifts")
+
+# Архив (archive.py): разыгранные и отменённые матчи старше ARCHIVE_AFTER_DAYS переезжают сюда
+# вместе со ставками, чтобы горячие таблицы и их индексы оставались маленькими.
+# Те же колонки и id, без внешних ключей; читают их history.py и stats.rebuild.
+
+class MatchArchive(Base):
+    __tablename__ = "matches_archive"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    status: Mapped[MatchStatus] = mapped_column(Enum(MatchStatus))
+    currency: Mapped[Currency] = mapped_column(Enum(Currency))
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+    resolved_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    winner_user_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    total_value_stars: Mapped[int] = mapped_column(Integer)
+    max_players: Mapped[int] = mapped_column(Integer)
+    lock_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    bets_count: Mapped[int] = mapped_column(Integer)
+
+class BetArchive(Base):
+    __tablename__ = "bets_archive"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    match_id: Mapped[int] = mapped_column(Integer)
+    user_id: Mapped[int] = mapped_column(Integer)
+    amount_stars: Mapped[int] = mapped_column(Integer)
+    value_stars: Mapped[int] = mapped_column(Integer)
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+
+    __table_args__ = (
+        Index("ix_bets_archive_user_created", "user_id", "created_at", "match_id"),
+        Index("ix_bets_archive_match", "match_id"),
+    )
+
+class BetGiftArchive(Base):
+    __tablename__ = "bet_gifts_archive"
+    bet_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    gift_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    qty: Mapped[int] = mapped_column(Integer)
+
+class LedgerEntry(Base):
+    __tablename__ = "ledger_entries"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"))
+    delta: Mapped[int] = mapped_column(Integer)  # + начисление, - списание
+    reason: Mapped[str] = mapped_column(String(32))  # bonus, grant, bet, payout...
+    match_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (Index("ix_ledger_user_id", "user_id", "id"),)
+
+class LedgerSnapshot(Base):
+    # одна строка: до какой проводки включительно балансы свёрнуты в users.stars_balance
+    __tablename__ = "ledger_snapshots"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    last_entry_id: Mapped[int] = mapped_column(Integer, default=0)
+    folded_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+class UserStats(Base):
+    # агрегаты по разыгранным матчам; обновляются при розыгрыше (stats.record_results),
+    # пересобираются из истории python stats.py rebuild
+    __tablename__ = "user_stats"
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    wins: Mapped[int] = mapped_column(Integer, default=0)
+    losses: Mapped[int] = mapped_column(Integer, default=0)
+    volume: Mapped[int] = mapped_column(Integer, default=0)  # сумма ставок в звёздах (по номиналу)
+    net: Mapped[int] = mapped_column(Integer, default=0)  # выигрыши минус ставки
+    commission: Mapped[int] = mapped_column(Integer, default=0)  # комиссия с выигрышей
+
+    # для рейтингов: ORDER BY <метрика> DESC LIMIT K по индексу
+    __table_args__ = (
+        Index("ix_user_stats_wins", "wins"),
+        Index("ix_user_stats_volume", "volume"),
+        Index("ix_user_stats_net", "net"),
+    )
+
+def _profile(db_url: str, profile: str) -> str:
+    if profile != "auto":
+        return profile
+    if db_url.startswith("sqlite"):
+        return "sqlite"
+    if db_url.startswith("postgresql"):
+        return "postgresql"
+    return "default"
+
+def _sqlite_pragmas(engine, read_only: bool):
+    cfg = get_config()
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, record):
+        cur = dbapi_conn.cursor()
+        # WAL: читатели не ждут писателя; NORMAL в WAL теряет при сбое питания лишь последние коммиты
+        if cfg.SQLITE_WAL:
+            cur.execute("PRAGMA journal_mode=WAL")
+            cur.execute("PRAGMA synchronous=NORMAL")
+        cur.execute(f"PRAGMA busy_timeout={cfg.SQLITE_BUSY_TIMEOUT_MS}")
+        cur.execute(f"PRAGMA mmap_size={cfg.SQLITE_MMAP_MB * 1024 * 1024}")
+        if read_only:
+            cur.execute("PRAGMA query_only=1")
+        cur.close()
+
+def get_engine(db_url: str | None = None, read_only: bool = False):
+    """
+    Engine по профилю DB_PROFILE (auto — по схеме URL):
+    sqlite — WAL, synchronous=NORMAL, mmap, busy_timeout; postgresql — размер пула, pre_ping, recycle.
+    read_only — для пула чтения: в SQLite соединения переводятся в query_only.
+    """
+    cfg = get_config()
+    db_url = db_url or cfg.DATABASE_URL
+    profile = _profile(db_url, cfg.DB_PROFILE)
+    if profile == "sqlite":
+        engine = create_engine(
+            db_url, echo=False, future=True,
+            # таймаут драйвера тоже в секундах ждёт блокировку, держим его в согласии с busy_timeout
+            connect_args={"check_same_thread": False, "timeout": cfg.SQLITE_BUSY_TIMEOUT_MS / 1000},
+        )
+        _sqlite_pragmas(engine, read_only)
+        return engine
+    if profile == "postgresql":
+        return create_engine(
+            db_url, echo=False, future=True,
+            pool_size=cfg.DB_POOL_SIZE, max_overflow=cfg.DB_MAX_OVERFLOW,
+            pool_pre_ping=cfg.DB_POOL_PRE_PING, pool_recycle=cfg.DB_POOL_RECYCLE,
+        )
+    return create_engine(db_url, echo=False, future=True)
 
-def get_engine():
-    db_url = os.getenv("DATABASE_URL", "sqlite:///pvp.sqlite3")
-    connect_args = {"check_same_thread": False} if db_url.startswith("sqlite") else {}
-    return create_engine(db_url, echo=False, future=True, connect_args=connect_args)
+def get_read_engine():
+    # реплика, если задана; иначе отдельный пул к основной БД, чтобы чтения не ждали соединений писателей.
+    # Базу в памяти делить между engine нельзя — там читаем через основной
+    cfg = get_config()
+    url = cfg.DATABASE_READ_URL or cfg.DATABASE_URL
+    if url in ("sqlite://", "sqlite:///:memory:"):
+        return engine
+    return get_engine(url, read_only=True)
 
 engine = get_engine()
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+# только для чтения: /api/me, /balance, /gifts, рейтинги. Пишем всегда через SessionLocal
+read_engine = get_read_engine()
+ReadSessionLocal = sessionmaker(bind=read_engine, autoflush=False, autocommit=False, future=True)
 
 def init_db():
     Base.metadata.create_all(engine)
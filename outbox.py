@@ -0,0 +1,242 @@
+# outbox.py
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import timedelta
+from typing import Awaitable, Callable, Dict, List
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+from config import get_config
+
+log = logging.getLogger(__name__)
+
+PRIORITY_REPLY = 0    # ответ на команду — пользователь ждёт
+PRIORITY_NOTIFY = 10  # рассылки и уведомления
+MAX_TEXT = 4096       # лимит Telegram на длину сообщения
+
+Sender = Callable[[int, str], Awaitable]
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        # через сколько секунд будет жетон (0 — уже есть)
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class _Chat:
+    __slots__ = ("texts", "priority", "bucket", "not_before", "scheduled", "sending", "attempts")
+
+    def __init__(self, bucket: TokenBucket):
+        self.texts: List[str] = []
+        self.priority = PRIORITY_NOTIFY
+        self.bucket = bucket
+        self.not_before = 0.0
+        self.scheduled = False
+        self.sending = False
+        self.attempts = 0
+
+    def pop_batch(self) -> tuple:
+        # склеиваем ожидающие сообщения чата в одно, пока влезают в MAX_TEXT
+        taken, size = 0, -2
+        for t in self.texts:
+            if taken and size + 2 + len(t) > MAX_TEXT:
+                break
+            taken, size = taken + 1, size + 2 + len(t)
+        batch, self.texts = self.texts[:taken], self.texts[taken:]
+        return "\n\n".join(batch), taken
+
+
+class Outbox:
+    """
+    Планировщик исходящих сообщений бота. Хэндлер вызывает enqueue() и сразу завершается;
+    фоновая задача в event loop бота отправляет с учётом лимитов Telegram:
+    общий token bucket на бота и свой на каждый чат, очередь по приоритету (меньше — раньше),
+    несколько ещё не отправленных сообщений одному чату склеиваются в одно.
+    RetryAfter — чат ставится на паузу и сообщение уходит позже; сетевые ошибки — повтор с паузой.
+    Отправитель подменяемый: bot.send_message, поддельный API (TELEGRAM_API_URL) или функция в тестах.
+    """
+
+    def __init__(self, sender: Sender | None = None, global_rate: float = 25, chat_rate: float = 1,
+                 chat_burst: float = 3, max_in_flight: int = 16, max_retries: int = 3):
+        self.sender = sender
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self._chats: Dict[int, _Chat] = {}
+        self._ready: list = []    # (priority, seq, chat_id)
+        self._delayed: list = []  # (когда, priority, seq, chat_id) — ждут жетон чата или RetryAfter
+        self._seq = itertools.count()
+        self._pending = 0         # сообщений в очереди и в отправке
+        self._gc_at = 0.0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._task: asyncio.Task | None = None
+        self._wakeup: asyncio.Event | None = None
+        self._idle: asyncio.Event | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._sends: set = set()  # ссылки на задачи отправки, чтобы их не собрал GC
+
+    def _ensure_started(self):
+        # задача живёт в loop вызывающего; новый loop (перезапуск, прогоны bench) — новая задача
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._task and not self._task.done():
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._ready, self._delayed = [], []
+        self._pending = sum(len(c.texts) for c in self._chats.values())
+        if self._pending == 0:
+            self._idle.set()
+        for chat_id, chat in self._chats.items():
+            chat.sending = False
+            chat.scheduled = False
+            if chat.texts:
+                self._schedule(chat_id, chat)
+        self._task = loop.create_task(self._run())
+
+    def enqueue(self, chat_id: int, text: str, priority: int = PRIORITY_REPLY):
+        """
+        Ставит сообщение в очередь, не дожидаясь отправки. Вызывать из event loop бота.
+        """
+        self._ensure_started()
+        chat = self._chats.get(chat_id)
+        if chat is None:
+            chat = self._chats[chat_id] = _Chat(TokenBucket(self.chat_rate, self.chat_burst))
+        chat.texts.append(text)
+        chat.priority = min(chat.priority, priority) if chat.scheduled or chat.sending else priority
+        self._pending += 1
+        self._idle.clear()
+        if not chat.scheduled and not chat.sending:
+            self._schedule(chat_id, chat)
+
+    async def drain(self):
+        """
+        Ждёт, пока уйдёт всё, что уже в очереди (остановка бота, конец прогона bench).
+        """
+        if self._idle is not None and self._task and not self._task.done():
+            await self._idle.wait()
+
+    def _schedule(self, chat_id: int, chat: _Chat):
+        chat.scheduled = True
+        heapq.heappush(self._ready, (chat.priority, next(self._seq), chat_id))
+        self._wakeup.set()
+
+    def _promote(self, now: float):
+        while self._delayed and self._delayed[0][0] <= now:
+            _, prio, seq, chat_id = heapq.heappop(self._delayed)
+            heapq.heappush(self._ready, (prio, seq, chat_id))
+
+    def _gc(self, now: float):
+        # чаты без очереди и с полным bucket больше ничем не ограничены — их состояние не нужно
+        idle = [cid for cid, c in self._chats.items()
+                if not c.texts and not c.sending and c.bucket.full(now)]
+        for cid in idle:
+            del self._chats[cid]
+        self._gc_at = now + 60
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            if now >= self._gc_at:
+                self._gc(now)
+            self._promote(now)
+            if not self._ready:
+                timeout = self._delayed[0][0] - now if self._delayed else 60
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            wait = self.global_bucket.delay(now)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            prio, seq, chat_id = heapq.heappop(self._ready)
+            chat = self._chats[chat_id]
+            wait = max(chat.not_before - now, chat.bucket.delay(now))
+            if wait > 0:
+                heapq.heappush(self._delayed, (now + wait, prio, seq, chat_id))
+                continue
+            await self._slots.acquire()
+            now = time.monotonic()
+            self.global_bucket.take(now)
+            chat.bucket.take(now)
+            chat.scheduled, chat.sending = False, True
+            text, count = chat.pop_batch()
+            task = self._loop.create_task(self._send(chat_id, chat, text, count))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+
+    async def _send(self, chat_id: int, chat: _Chat, text: str, count: int):
+        done = count
+        try:
+            await self.sender(chat_id, text)
+            chat.attempts = 0
+        except RetryAfter as e:
+            retry_after = e.retry_after
+            if isinstance(retry_after, timedelta):
+                retry_after = retry_after.total_seconds()
+            log.warning("outbox: flood control for chat %s, retry in %ss", chat_id, retry_after)
+            chat.not_before = time.monotonic() + float(retry_after)
+            chat.texts.insert(0, text)
+            done = count - 1
+        except (BadRequest, Forbidden) as e:
+            # пользователь заблокировал бота или чат недоступен — повтор не поможет
+            log.info("outbox: dropped message to chat %s: %s", chat_id, e)
+            chat.attempts = 0
+        except (NetworkError, asyncio.TimeoutError) as e:
+            chat.attempts += 1
+            if chat.attempts <= self.max_retries:
+                chat.not_before = time.monotonic() + 0.5 * 2 ** chat.attempts
+                chat.texts.insert(0, text)
+                done = count - 1
+            else:
+                log.warning("outbox: gave up on chat %s after %s attempts: %s", chat_id, chat.attempts, e)
+                chat.attempts = 0
+        except Exception:
+            log.exception("outbox: send to chat %s failed", chat_id)
+            chat.attempts = 0
+        finally:
+            chat.sending = False
+            self._slots.release()
+            self._pending -= done
+            if chat.texts:
+                self._schedule(chat_id, chat)
+            if self._pending == 0:
+                self._idle.set()
+
+
+def make_outbox() -> Outbox:
+    cfg = get_config()
+    return Outbox(
+        global_rate=cfg.OUTBOX_GLOBAL_RATE, chat_rate=cfg.OUTBOX_CHAT_RATE,
+        chat_burst=cfg.OUTBOX_CHAT_BURST, max_in_flight=cfg.OUTBOX_MAX_IN_FLIGHT,
+        max_retries=cfg.OUTBOX_MAX_RETRIES,
+    )
+
+
+outbox = make_outbox()
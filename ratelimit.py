@@ -0,0 +1,132 @@
+# ratelimit.py
+import asyncio
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Tuple
+from sqlalchemy import BigInteger, Column, Float, Integer, MetaData, String, Table, text
+from models import get_engine
+from db_executor import get_executor
+from config import get_config
+
+
+@dataclass(frozen=True)
+class RatePolicy:
+    limit: int  # сколько действий
+    window: float  # за сколько секунд
+
+
+def parse_policies(spec: str) -> Dict[str, RatePolicy]:
+    """
+    "fight=1/10,start_fight=1/10" -> {"fight": RatePolicy(1, 10.0), ...}
+    """
+    policies: Dict[str, RatePolicy] = {}
+    for part in (p.strip() for p in spec.split(",") if p.strip()):
+        action, rule = part.split("=")
+        limit, window = rule.split("/")
+        policies[action.strip()] = RatePolicy(int(limit), float(window))
+    return policies
+
+
+class MemoryRateLimiter:
+    """
+    Скользящее окно в памяти процесса: на ключ — очередь из не более limit отметок времени,
+    проверка O(1). Годится, когда web и бот живут в одном процессе.
+    """
+
+    def __init__(self, policies: Dict[str, RatePolicy]):
+        self.policies = policies
+        self._lock = threading.Lock()
+        self._hits: Dict[Tuple[str, int], Deque[float]] = {}
+        self._last_gc = time.monotonic()
+
+    def allow(self, action: str, key: int) -> bool:
+        policy = self.policies.get(action)
+        if policy is None:
+            return True
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_gc > 60:
+                self._gc(now)
+            hits = self._hits.get((action, key))
+            if hits is None:
+                hits = self._hits[(action, key)] = deque(maxlen=policy.limit)
+            if len(hits) == policy.limit and now - hits[0] < policy.window:
+                return False
+            hits.append(now)
+            return True
+
+    async def allow_async(self, action: str, key: int) -> bool:
+        # проверка в памяти не блокирует — прямо в event loop
+        return self.allow(action, key)
+
+    def _gc(self, now: float):
+        # ключи, у которых последнее действие старше окна, больше ничего не ограничивают
+        for k in [k for k, hits in self._hits.items()
+                  if not hits or now - hits[-1] >= self.policies[k[0]].window]:
+            del self._hits[k]
+        self._last_gc = now
+
+
+_metadata = MetaData()
+
+rate_limit_windows = Table(
+    "rate_limit_windows", _metadata,
+    Column("action", String(32), primary_key=True),
+    Column("key", BigInteger, primary_key=True),
+    Column("window_start", Float, nullable=False),
+    Column("hits", Integer, nullable=False),
+)
+
+
+class SqlRateLimiter:
+    """
+    Общий для нескольких процессов лимитер: фиксированное окно, одна строка на (action, key),
+    проверка и учёт — один UPSERT ... RETURNING. По умолчанию — отдельный SQLite-файл,
+    чтобы не конкурировать за блокировку с основной БД; engine — с тем же профилем, что и основной
+    (models.get_engine: WAL и busy_timeout), чтобы процессы ждали блокировку, а не падали.
+    Из бота — allow_async: запрос уходит в пул потоков db_executor и не блокирует event loop.
+    """
+
+    _UPSERT = text(
+        "INSERT INTO rate_limit_windows (action, key, window_start, hits) "
+        "VALUES (:action, :key, :now, 1) "
+        "ON CONFLICT (action, key) DO UPDATE SET "
+        "hits = CASE WHEN :now - rate_limit_windows.window_start >= :window "
+        "THEN 1 ELSE rate_limit_windows.hits + 1 END, "
+        "window_start = CASE WHEN :now - rate_limit_windows.window_start >= :window "
+        "THEN :now ELSE rate_limit_windows.window_start END "
+        "RETURNING hits"
+    )
+
+    def __init__(self, policies: Dict[str, RatePolicy], db_url: str):
+        self.policies = policies
+        self.engine = get_engine(db_url)
+        _metadata.create_all(self.engine)
+
+    def allow(self, action: str, key: int) -> bool:
+        policy = self.policies.get(action)
+        if policy is None:
+            return True
+        with self.engine.begin() as conn:
+            hits = conn.execute(self._UPSERT, {
+                "action": action, "key": key, "now": time.time(), "window": policy.window,
+            }).scalar_one()
+        return hits <= policy.limit
+
+    async def allow_async(self, action: str, key: int) -> bool:
+        if action not in self.policies:
+            return True
+        return await asyncio.get_running_loop().run_in_executor(get_executor(), self.allow, action, key)
+
+
+def make_rate_limiter():
+    cfg = get_config()
+    policies = parse_policies(cfg.RATE_LIMITS)
+    if cfg.RATE_LIMIT_BACKEND == "sql":
+        return SqlRateLimiter(policies, cfg.RATE_LIMIT_DB_URL)
+    return MemoryRateLimiter(policies)
+
+
+rate_limiter = make_rate_limiter()
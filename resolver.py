@@ -0,0 +1,117 @@
+# resolver.py
+import logging
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from typing import Dict
+from models import SessionLocal
+from logic import lock_due_pools, resolve_locked_batch, settled_results
+from config import get_config
+
+log = logging.getLogger(__name__)
+
+
+class BatchResolver:
+    """
+    Фоновый поток, который разыгрывает LOCKED-матчи пачками (resolve_locked_batch).
+    Кто ждёт результат конкретного матча, берёт Future через submit(match_id).
+    Матчи, оставшиеся LOCKED после рестарта, подбираются тем же проходом.
+    Каждый проход сначала закрывает пулы с истёкшим временем (lock_due_pools);
+    отменённый пул (меньше двух ставок) отдаёт ждущим {"canceled": True}.
+    Ждущие, чей матч уже разыгран (другим процессом или проходом, начавшимся до их submit),
+    получают итог из БД (settled_results) в конце ближайшего прохода.
+    """
+
+    def __init__(self, batch_size: int = 500, interval: float = 0.02):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._waiters: Dict[int, Future] = {}
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="batch-resolver", daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, match_id: int) -> Future:
+        self.start()
+        with self._lock:
+            fut = self._waiters.setdefault(match_id, Future())
+        self._wakeup.set()
+        return fut
+
+    def discard(self, match_id: int):
+        # матч так и не записан (откат) — ждать нечего
+        with self._lock:
+            fut = self._waiters.pop(match_id, None)
+        if fut:
+            fut.cancel()
+
+    def result(self, match_id: int, timeout: float) -> dict:
+        """
+        Итог матча: из пачки резолвера, а если не дождались — из БД.
+        TimeoutError — матч всё ещё не разыгран.
+        """
+        fut = self.submit(match_id)
+        try:
+            return fut.result(timeout=timeout)
+        except FutureTimeout:
+            self._answer_settled([match_id])
+            return fut.result(timeout=0)
+
+    def _answer_settled(self, match_ids) -> int:
+        s = SessionLocal()
+        try:
+            settled = settled_results(s, list(match_ids))
+        finally:
+            s.close()
+        self._answer(settled)
+        return len(settled)
+
+    def _answer(self, results: Dict[int, dict]):
+        with self._lock:
+            for mid, r in results.items():
+                fut = self._waiters.pop(mid, None)
+                if fut:
+                    fut.set_result(r)
+
+    def run_once(self) -> int:
+        s = SessionLocal()
+        try:
+            canceled = lock_due_pools(s)
+            results = resolve_locked_batch(s, self.batch_size)
+        finally:
+            s.close()
+        results.update({mid: {"canceled": True} for mid in canceled})
+        self._answer(results)
+        with self._lock:
+            pending = list(self._waiters)
+        if pending:
+            self._answer_settled(pending)
+        return len(results) - len(canceled)
+
+    def _run(self):
+        while not self._stop.is_set():
+            # копим ставки interval секунд, чтобы в пачку попало побольше матчей
+            self._wakeup.wait(timeout=1.0)
+            self._stop.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                while self.run_once() >= self.batch_size:
+                    pass
+            except Exception:
+                log.exception("batch resolve failed")
+
+
+_cfg = get_config()
+resolver = BatchResolver(batch_size=_cfg.RESOLVER_BATCH_SIZE, interval=_cfg.RESOLVER_INTERVAL_MS / 1000)
@@ -0,0 +1,266 @@
+# stats.py
+"""
+Статистика игроков (user_stats) и рейтинги.
+
+    python stats.py rebuild   — пересобрать user_stats по истории матчей одним потоковым проходом
+"""
+import argparse
+import heapq
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+from dotenv import load_dotenv
+load_dotenv()  # до импорта модулей проекта: они читают конфиг при импорте
+from sqlalchemy import delete, event, func, insert, select, text, union_all
+from sqlalchemy.orm import Session
+from models import (
+    BOT_OPPONENT_USERNAME, Bet, BetArchive, LedgerEntry, Match, MatchArchive, MatchStatus, User, UserStats,
+    SessionLocal
+)
+from config import get_config
+
+METRICS = ("wins", "volume", "net")
+_FIELDS = ("wins", "losses", "volume", "net", "commission")
+
+_UPSERT = text(
+    "INSERT INTO user_stats (user_id, wins, losses, volume, net, commission) "
+    "VALUES (:user_id, :wins, :losses, :volume, :net, :commission) "
+    "ON CONFLICT (user_id) DO UPDATE SET "
+    "wins = user_stats.wins + excluded.wins, losses = user_stats.losses + excluded.losses, "
+    "volume = user_stats.volume + excluded.volume, net = user_stats.net + excluded.net, "
+    "commission = user_stats.commission + excluded.commission"
+)
+
+
+def match_deltas(bets: Iterable[Tuple[int, int]], winner_user_id: int, pool: int, commission: int) -> List[dict]:
+    """
+    Приращения user_stats за один разыгранный матч. bets: [(user_id, value_stars)].
+    Комиссия удерживается из выигрыша, поэтому записывается победителю.
+    """
+    payout = pool - commission
+    out = []
+    for user_id, value in bets:
+        won = user_id == winner_user_id
+        out.append({
+            "user_id": user_id, "wins": int(won), "losses": int(not won), "volume": value,
+            "net": payout - value if won else -value, "commission": commission if won else 0,
+        })
+    return out
+
+
+def record_results(s: Session, deltas: List[dict]):
+    """
+    Добавляет приращения в user_stats в текущей транзакции (один executemany UPSERT).
+    Новые значения читаются здесь же и после commit уходят в рейтинги этого процесса.
+    """
+    merged: Dict[int, dict] = {}
+    for d in deltas:
+        row = merged.get(d["user_id"])
+        if row is None:
+            merged[d["user_id"]] = dict(d)
+        else:
+            for f in _FIELDS:
+                row[f] += d[f]
+    if not merged:
+        return
+    s.execute(_UPSERT, list(merged.values()))
+    rows = s.execute(
+        select(UserStats.user_id, UserStats.wins, UserStats.volume, UserStats.net)
+        .where(UserStats.user_id.in_(merged))
+    ).all()
+    s.info.setdefault("stats_rows", []).extend(rows)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_stats(s: Session):
+    rows = s.info.pop("stats_rows", None)
+    if rows:
+        leaderboard.offer(rows)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_stats(s: Session, previous_transaction):
+    s.info.pop("stats_rows", None)
+
+
+# --- рейтинги ---
+
+class TopK:
+    """
+    Лучшие по одной метрике: держим до cap игроков, bound — верхняя граница значений всех остальных.
+    Пока k-й из удерживаемых не ниже bound, первые k точны; иначе нужно перечитать из БД.
+    """
+
+    def __init__(self, cap: int):
+        self.cap = cap
+        self.values: Dict[int, int] = {}
+        self.bound = float("-inf")
+        self.loaded_at = 0.0
+
+    def load(self, rows: List[Tuple[int, int]]):
+        # rows — первые cap + 1 по убыванию
+        self.values = dict(rows[:self.cap])
+        self.bound = rows[self.cap][1] if len(rows) > self.cap else float("-inf")
+        self.loaded_at = time.monotonic()
+
+    def offer(self, user_id: int, value: int):
+        if user_id not in self.values and value <= self.bound:
+            return
+        self.values[user_id] = value
+        if len(self.values) > self.cap:
+            worst = min(self.values, key=self.values.get)
+            self.bound = max(self.bound, self.values.pop(worst))
+
+    def discard(self, user_id: int):
+        value = self.values.pop(user_id, None)
+        if value is not None:
+            self.bound = max(self.bound, value)
+
+    def top(self, k: int) -> List[Tuple[int, int]] | None:
+        best = heapq.nlargest(k, self.values.items(), key=lambda kv: kv[1])
+        if len(best) < k and self.bound != float("-inf"):
+            return None
+        if best and best[-1][1] < self.bound:
+            return None
+        return best
+
+
+class Leaderboard:
+    """
+    Рейтинги по METRICS в памяти процесса. Чтение — O(k) из памяти; из БД (ORDER BY ... LIMIT по индексу)
+    перечитываем, только если топ мог устареть: вытеснили тех, кто теперь выше, или прошло
+    refresh_seconds — за это время могли отыграть матчи в других процессах.
+    Боты-соперники в рейтинг не попадают.
+    """
+
+    def __init__(self, k: int = 100, refresh_seconds: float = 30):
+        self.k = k
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._boards = {m: TopK(2 * k) for m in METRICS}
+        self._names: Dict[int, str] = {}
+        self._hidden: set = set()
+
+    def offer(self, rows):
+        with self._lock:
+            for row in rows:
+                if row.user_id in self._hidden:
+                    continue
+                for m in METRICS:
+                    self._boards[m].offer(row.user_id, getattr(row, m))
+
+    def _reload(self, s: Session, metric: str):
+        board = self._boards[metric]
+        column = getattr(UserStats, metric)
+        rows = s.execute(
+            select(UserStats.user_id, column, User.username, User.tg_id)
+            .join(User, User.id == UserStats.user_id)
+            .where(func.coalesce(User.username, "") != BOT_OPPONENT_USERNAME)
+            .order_by(column.desc())
+            .limit(board.cap + 1)
+        ).all()
+        with self._lock:
+            board.load([(r[0], r[1]) for r in rows])
+            for r in rows:
+                self._names[r[0]] = r.username or str(r.tg_id)
+
+    def _load_names(self, s: Session, user_ids: List[int]):
+        rows = s.execute(select(User.id, User.username, User.tg_id).where(User.id.in_(user_ids))).all()
+        with self._lock:
+            for r in rows:
+                if r.username == BOT_OPPONENT_USERNAME:
+                    self._hidden.add(r.id)
+                    for board in self._boards.values():
+                        board.discard(r.id)
+                else:
+                    self._names[r.id] = r.username or str(r.tg_id)
+
+    def top(self, s: Session, metric: str, limit: int) -> List[dict]:
+        """
+        Первые limit (не больше k) по метрике: [{"user_id", "name", "value"}].
+        s — сессия чтения; используется, только если топ надо перечитать.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"Неизвестная метрика {metric}.")
+        limit = max(1, min(limit, self.k))
+        board = self._boards[metric]
+        best = None
+        for _ in range(3):
+            with self._lock:
+                fresh = time.monotonic() - board.loaded_at < self.refresh_seconds
+                best = board.top(limit) if fresh else None
+            if best is None:
+                self._reload(s, metric)
+                continue
+            missing = [uid for uid, _ in best if uid not in self._names]
+            if not missing:
+                break
+            self._load_names(s, missing)
+        best = best or []
+        return [{"user_id": uid, "name": self._names.get(uid, str(uid)), "value": v} for uid, v in best]
+
+
+_cfg = get_config()
+leaderboard = Leaderboard(k=_cfg.LEADERBOARD_SIZE, refresh_seconds=_cfg.LEADERBOARD_REFRESH_SECONDS)
+
+
+# --- пересборка ---
+
+def rebuild(s: Session, chunk: int = 10_000, progress=None) -> int:
+    """
+    Пересчитывает user_stats по разыгранным матчам (горячие таблицы и архив) одним потоковым проходом
+    по ставкам (выплата матча — из журнала, комиссия = пул - выплата) и заменяет таблицу одной транзакцией.
+    Память — O(игроков), не O(истории). Возвращает число игроков.
+    """
+    payouts = (
+        select(LedgerEntry.match_id, func.sum(LedgerEntry.delta).label("payout"))
+        .where(LedgerEntry.reason == "payout")
+        .group_by(LedgerEntry.match_id)
+        .subquery()
+    )
+    q = union_all(*(
+        select(bet.user_id, bet.value_stars, match.winner_user_id, match.total_value_stars, payouts.c.payout)
+        .join(match, match.id == bet.match_id)
+        .outerjoin(payouts, payouts.c.match_id == match.id)
+        .where(match.status == MatchStatus.RESOLVED)
+        for bet, match in ((Bet, Match), (BetArchive, MatchArchive))
+    )).execution_options(yield_per=chunk)
+    acc: Dict[int, List[int]] = {}
+    seen = 0
+    for user_id, value, winner_id, pool, payout in s.execute(q):
+        payout = pool if payout is None else payout
+        row = acc.get(user_id)
+        if row is None:
+            row = acc[user_id] = [0, 0, 0, 0, 0]
+        won = user_id == winner_id
+        row[0] += won
+        row[1] += not won
+        row[2] += value
+        row[3] += payout - value if won else -value
+        row[4] += pool - payout if won else 0
+        seen += 1
+        if progress and seen % chunk == 0:
+            progress(seen)
+    s.execute(delete(UserStats))
+    rows = [dict(zip(("user_id",) + _FIELDS, (uid, *vals))) for uid, vals in acc.items()]
+    for i in range(0, len(rows), chunk):
+        s.execute(insert(UserStats), rows[i:i + chunk])
+    s.commit()
+    return len(acc)
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    p.add_argument("command", choices=["rebuild"])
+    p.add_argument("--chunk", type=int, default=10_000)
+    args = p.parse_args(argv)
+    s = SessionLocal()
+    try:
+        n = rebuild(s, args.chunk, progress=lambda seen: print(f"ставок: {seen}", flush=True))
+    finally:
+        s.close()
+    print(f"готово: игроков {n}")
+
+
+if __name__ == "__main__":
+    main()
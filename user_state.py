@@ -0,0 +1,147 @@
+# user_state.py
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session, joinedload
+from models import User
+from catalog import gift_catalog
+from live import hub, STATE_CHANGED
+from config import get_config
+
+
+class UserStateCache:
+    """
+    Снимки "баланс + инвентарь" по tg_id. Сбрасываются после коммита, который менял пользователя
+    (touch_users -> after_commit), и при смене версии справочника подарков.
+    Коммиты других процессов сюда не доходят — для них снимок живёт не дольше ttl секунд (0 — бессрочно).
+    Снимков не больше max_entries: сверх лимита вытесняется давно не читанный (LRU),
+    протухшие удаляются при чтении.
+    """
+
+    def __init__(self, ttl: float = 0, max_entries: int = 10_000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # tg_id -> (снимок, когда протухнет), от давно читанных к недавним
+        self._by_tg: "OrderedDict[int, Tuple[dict, float]]" = OrderedDict()
+        self._tg_of: Dict[int, int] = {}  # user_id -> tg_id
+        # растёт при каждом сбросе; снимок, прочитанный до сброса, в кэш не кладём
+        self.generation = 0
+
+    def get(self, tg_id: int) -> dict | None:
+        catalog_version = gift_catalog.current_version()
+        with self._lock:
+            entry = self._by_tg.get(tg_id)
+            if entry is None:
+                return None
+            snap, expires_at = entry
+            if snap["catalog_version"] != catalog_version or time.monotonic() > expires_at:
+                self._drop(tg_id)
+                return None
+            self._by_tg.move_to_end(tg_id)
+            return snap
+
+    def put(self, tg_id: int, snap: dict, generation: int):
+        with self._lock:
+            if generation != self.generation:
+                return
+            expires_at = time.monotonic() + self.ttl if self.ttl > 0 else float("inf")
+            self._by_tg[tg_id] = (snap, expires_at)
+            self._by_tg.move_to_end(tg_id)
+            self._tg_of[snap["user_id"]] = tg_id
+            while len(self._by_tg) > self.max_entries:
+                self._drop(next(iter(self._by_tg)))
+
+    def _drop(self, tg_id: int):
+        # под self._lock
+        snap, _ = self._by_tg.pop(tg_id)
+        if self._tg_of.get(snap["user_id"]) == tg_id:
+            del self._tg_of[snap["user_id"]]
+
+    def invalidate_users(self, user_ids):
+        with self._lock:
+            self.generation += 1
+            for uid in user_ids:
+                tg_id = self._tg_of.pop(uid, None)
+                if tg_id is not None:
+                    self._by_tg.pop(tg_id, None)
+
+
+_cfg = get_config()
+state_cache = UserStateCache(ttl=_cfg.CACHE_TTL, max_entries=_cfg.CACHE_MAX_USERS)
+
+
+def touch_users(s: Session, *user_ids: int):
+    # снимки этих пользователей сбросятся после commit сессии
+    s.info.setdefault("touched_users", set()).update(user_ids)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_touched(s: Session):
+    touched = s.info.pop("touched_users", None)
+    if touched:
+        state_cache.invalidate_users(touched)
+        hub.publish_many((uid, STATE_CHANGED) for uid in touched)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _forget_touched(s: Session, previous_transaction):
+    s.info.pop("touched_users", None)
+
+
+def load_user_state(s: Session, tg_id: int, username: str | None = None, create: bool = True) -> dict | None:
+    """
+    Снимок пользователя одним запросом (users JOIN inventory_items) плюс баланс по журналу,
+    названия и номиналы подарков — из gift_catalog. Кладёт снимок в кэш.
+    create=False — для сессии чтения: нового пользователя не заводим, возвращаем None.
+    """
+    # версии берём до чтения: если во время запроса что-то сменится, снимок не закэшируется
+    generation = state_cache.generation
+    catalog_version = gift_catalog.current_version()
+    user = (
+        s.query(User)
+        .options(joinedload(User.inventory_items))
+        .filter_by(tg_id=tg_id)
+        .one_or_none()
+    )
+    if user is None:
+        if not create:
+            return None
+        from logic import get_or_create_user
+        user = get_or_create_user(s, tg_id, username)
+    from ledger import balance_of
+    gifts = []
+    for i in sorted(user.inventory_items, key=lambda i: i.id):
+        gift = gift_catalog.by_id(i.gift_id)
+        if gift:
+            gifts.append({"code": gift.code, "title": gift.title, "qty": i.qty, "value": gift.value_stars})
+    body = {"stars": balance_of(s, user.id), "gifts": gifts}
+    etag = hashlib.sha1(json.dumps(body, sort_keys=True, ensure_ascii=False).encode()).hexdigest()[:16]
+    snap = {"user_id": user.id, "catalog_version": catalog_version, "etag": etag, **body}
+    state_cache.put(tg_id, snap, generation)
+    return snap
+
+
+def state_delta(old: dict, new: dict) -> dict:
+    """
+    Что изменилось между снимками: {"stars", "stars_delta", "gifts": [{"code", "title", "value", "qty", "qty_delta"}]}.
+    В gifts только подарки, чьё количество поменялось (qty = 0 — подарков не осталось).
+    """
+    old_by = {g["code"]: g for g in old["gifts"]}
+    new_by = {g["code"]: g for g in new["gifts"]}
+    gifts = []
+    for code in sorted(old_by.keys() | new_by.keys()):
+        was = old_by[code]["qty"] if code in old_by else 0
+        now = new_by[code]["qty"] if code in new_by else 0
+        if was != now:
+            g = new_by.get(code) or old_by[code]
+            gifts.append({"code": code, "title": g["title"], "value": g["value"], "qty": now, "qty_delta": now - was})
+    return {"stars": new["stars"], "stars_delta": new["stars"] - old["stars"], "gifts": gifts}
+
+
+def get_user_state(s: Session, tg_id: int, username: str | None = None, create: bool = True) -> dict | None:
+    return state_cache.get(tg_id) or load_user_state(s, tg_id, username, create)
@@ -0,0 +1,247 @@
+# web.py
+"""
+Веб-часть: API мини-приложения и статика. telegram здесь не импортируется.
+Прод: gunicorn -c gunicorn.conf.py wsgi:application; разработка: python app.py (вместе с ботом).
+"""
+import os
+import json
+import time
+from flask import Flask, Response, request, jsonify, make_response, send_from_directory, stream_with_context
+from dotenv import load_dotenv
+load_dotenv()  # до импорта модулей проекта: они читают конфиг при импорте
+from sqlalchemy.orm import Session
+from models import engine, read_engine, SessionLocal, ReadSessionLocal, Currency
+from logic import get_or_create_user, parse_gifts_blob, check_stake, enter_pool
+from ratelimit import rate_limiter
+from user_state import state_cache, load_user_state, get_user_state, state_delta
+from live import hub
+from matchmaking import Ticket, matchmaker, wait_result
+from stats import METRICS, leaderboard
+from history import MAX_PAGE, history_by_tg
+from metrics import instrument_engine, instrument_flask, render as render_metrics
+from config import get_config
+
+cfg = get_config()
+
+app = Flask(__name__, static_folder="webapp", static_url_path="")
+instrument_engine(engine)
+instrument_engine(read_engine)
+instrument_flask(app)
+
+# --------- API для мини-приложения ---------
+
+def get_session() -> Session:
+    return SessionLocal()
+
+def get_read_session() -> Session:
+    return ReadSessionLocal()
+
+def resolve_tg_user_from_webapp(initData) -> int:
+    """
+    Упрощённо: из initDataUnsafe берём user.id, здесь не проводим подпись/проверку.
+    Для продакшена проверь хэш подписи по документу Telegram WebApp.
+    """
+    # для MVP принимаем tg_id из заглушки (небезопасно, но быстро)
+    # на фронте мы не шлём весь initDataUnsafe — в реальном проекте реализуй проверку подписи!
+    return int(os.getenv("ADMIN_USER_ID", "0"))  # fallback: твой аккаунт
+
+def current_state(tg_user_id: int, cached: bool = True) -> dict:
+    # снимок из кэша: если ничего не менялось, в БД не ходим вовсе
+    state = state_cache.get(tg_user_id) if cached else None
+    if state is None:
+        s = get_read_session()
+        try:
+            state = load_user_state(s, tg_user_id, create=False)
+        finally:
+            s.close()
+    if state is None:
+        # новый пользователь — заводим через основную БД
+        s = get_session()
+        try:
+            state = load_user_state(s, tg_user_id)
+        finally:
+            s.close()
+    return state
+
+@app.post("/api/me")
+def api_me():
+    tg_user_id = resolve_tg_user_from_webapp(request.json.get("initData"))
+    state = current_state(tg_user_id)
+    if request.if_none_match.contains(state["etag"]):
+        resp = make_response("", 304)
+    else:
+        resp = jsonify({"ok": True, "me": {"stars": state["stars"], "gifts": state["gifts"]}})
+    resp.set_etag(state["etag"])
+    return resp
+
+@app.post("/api/start_fight")
+def api_start_fight():
+    payload = request.json.get("payload") or {}
+    currency = payload.get("currency")
+    bet = payload.get("bet") or {}
+    s = get_session()
+    try:
+        tg_user_id = resolve_tg_user_from_webapp(request.json.get("initData"))
+        if not rate_limiter.allow("start_fight", tg_user_id):
+            return jsonify({"ok": False, "error": "Слишком часто. Подождите несколько секунд."})
+        user = get_or_create_user(s, tg_user_id)
+
+        if currency not in ("stars", "gifts"):
+            return jsonify({"ok": False, "error": "Неверная валюта."})
+        cur = Currency.STARS if currency == "stars" else Currency.GIFTS
+
+        if cur == Currency.STARS:
+            stake = int(bet.get("amount", 0))
+        else:
+            stake = parse_gifts_blob(bet.get("gifts", ""))
+
+        ok, msg, value = check_stake(s, user, cur, stake)
+        if not ok:
+            return jsonify({"ok": False, "error": msg})
+        user_id = user.id
+        before = get_user_state(s, tg_user_id)
+        s.close()  # пока ждём соперника, соединение с БД не держим
+
+        # заявка в очередь подбора; если живой соперник не найдётся за MATCH_WAIT_SECONDS —
+        # бой с ботом. Матч пишется в БД одной транзакцией, когда пара сложилась.
+        ticket = Ticket(user_id, cur, stake, value)
+        if not matchmaker.submit(ticket):
+            return jsonify({"ok": False, "error": "Вы уже ищете соперника."})
+        ok, msg, res = wait_result(matchmaker, ticket)
+        if not ok:
+            return jsonify({"ok": False, "error": msg})
+
+        detail = res["detail"]
+        message = f"Матч #{res['match_id']} разыгран. Пул: {res['pool']}⭐️, комиссия: {res['commission']}⭐️."
+        if detail.get("type") == "gift":
+            message += f" Комиссия взята подарком {detail['gift_code']} (⭐️{detail['gift_value']})."
+        message += (" Победа за вами! 🎉" if res["winner_user_id"] == user_id else " Увы, вы проиграли.")
+        # новый снимок — из основной БД мимо кэша: выплату мог записать другой процесс
+        # (резолвер при RESOLVER_BATCH, бот), и сброс кэша сюда не дошёл
+        s = get_session()
+        after = load_user_state(s, tg_user_id)
+        return jsonify({"ok": True, "message": message,
+                        "me": {"stars": after["stars"], "gifts": after["gifts"]},
+                        "delta": state_delta(before, after)})
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)})
+    finally:
+        s.close()
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@app.get("/api/stream")
+def api_stream():
+    """
+    Server-Sent Events: state — полный снимок при подключении и после потери событий,
+    delta — изменения баланса и подарков (user_state.state_delta), match — итог матча.
+    EventSource не умеет тело запроса, поэтому initData — в query string.
+    Нет свободной подписки (live.Hub) — 503, клиент обновляется опросом /api/me.
+    """
+    tg_user_id = resolve_tg_user_from_webapp(request.args.get("initData"))
+    state = current_state(tg_user_id)
+    sub = hub.subscribe(state["user_id"])
+    if sub is None:
+        return Response("", 503, headers={"Retry-After": "30"})
+
+    def stream(last: dict):
+        try:
+            yield "retry: 3000\n\n"
+            yield _sse("state", {"stars": last["stars"], "gifts": last["gifts"]})
+            deadline = time.monotonic() + cfg.SSE_STREAM_SECONDS
+            while time.monotonic() < deadline:
+                ev = sub.get(timeout=cfg.SSE_HEARTBEAT_SECONDS)
+                if ev is not None and ev["type"] == "match":
+                    yield _sse("match", ev)
+                    continue
+                if sub.lost:
+                    sub.lost = False
+                    last = current_state(tg_user_id, cached=False)
+                    yield _sse("state", {"stars": last["stars"], "gifts": last["gifts"]})
+                    continue
+                # ev = None: пульс — заодно подхватываем изменения из других процессов
+                new = current_state(tg_user_id, cached=ev is not None)
+                if new["etag"] != last["etag"]:
+                    yield _sse("delta", state_delta(last, new))
+                    last = new
+                elif ev is None:
+                    yield ": ping\n\n"
+        finally:
+            hub.unsubscribe(sub)
+
+    return Response(stream_with_context(stream(state)), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/api/join_pool")
+def api_join_pool():
+    """
+    Ставка в текущий общий пул. Итог розыгрыша — после lock_at (в /api/me обновится баланс).
+    """
+    payload = request.json.get("payload") or {}
+    currency = payload.get("currency")
+    bet = payload.get("bet") or {}
+    if currency not in ("stars", "gifts"):
+        return jsonify({"ok": False, "error": "Неверная валюта."})
+    cur = Currency.STARS if currency == "stars" else Currency.GIFTS
+    stake = int(bet.get("amount", 0)) if cur == Currency.STARS else parse_gifts_blob(bet.get("gifts", ""))
+    s = get_session()
+    try:
+        tg_user_id = resolve_tg_user_from_webapp(request.json.get("initData"))
+        user = get_or_create_user(s, tg_user_id)
+        ok, msg, pool = enter_pool(s, cur, user, stake)
+        if not ok:
+            return jsonify({"ok": False, "error": msg})
+        return jsonify({"ok": True, "message": msg, "match_id": pool["match_id"],
+                        "lock_at": pool["lock_at"].isoformat() + "Z"})
+    except Exception as e:
+        return jsonify({"ok": False, "error": str(e)})
+    finally:
+        s.close()
+
+@app.post("/api/history")
+def api_history():
+    """
+    История матчей, новые сверху: payload {"cursor"?, "limit"?}; в ответе next_cursor — null на последней странице.
+    """
+    payload = request.json.get("payload") or {}
+    tg_user_id = resolve_tg_user_from_webapp(request.json.get("initData"))
+    try:
+        limit = max(1, min(int(payload.get("limit", 20)), MAX_PAGE))
+    except (TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Неверный размер страницы (limit)."})
+    s = get_read_session()
+    try:
+        items, next_cursor = history_by_tg(s, tg_user_id, limit, payload.get("cursor"))
+    except ValueError:
+        return jsonify({"ok": False, "error": "Неверный курсор."})
+    finally:
+        s.close()
+    for it in items:
+        it["created_at"] = it["created_at"].isoformat() + "Z"
+        it["resolved_at"] = it["resolved_at"] and it["resolved_at"].isoformat() + "Z"
+    return jsonify({"ok": True, "items": items, "next_cursor": next_cursor})
+
+@app.get("/api/leaderboard")
+def api_leaderboard():
+    """
+    Топ игроков: ?metric=wins|volume|net&limit=10. Отдаётся из памяти процесса (stats.leaderboard).
+    """
+    metric = request.args.get("metric", "wins")
+    if metric not in METRICS:
+        return jsonify({"ok": False, "error": "Неверная метрика."})
+    limit = request.args.get("limit", 10, type=int)
+    s = get_read_session()
+    try:
+        return jsonify({"ok": True, "metric": metric, "top": leaderboard.top(s, metric, limit)})
+    finally:
+        s.close()
+
+@app.get("/metrics")
+def metrics():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+# отдаём статику мини-приложения
+@app.get("/")
+def index():
+    return send_from_directory("webapp", "index.html")
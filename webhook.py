@@ -0,0 +1,153 @@
+# webhook.py
+"""
+Приём апдейтов Telegram вебхуком в процессе бота.
+HTTP-сервер (stdlib, свой поток) проверяет X-Telegram-Bot-Api-Secret-Token и кладёт апдейт
+в ограниченную очередь; её разбирают BOT_CONCURRENT_UPDATES задач через application.process_update.
+Очередь полна — отвечаем 503 с Retry-After, Telegram повторит доставку позже.
+Своя очередь, а не application.update_queue: update_fetcher PTB при concurrent_updates сразу
+заводит задачу на каждый апдейт, и очередь Application никогда не заполняется.
+
+Локальная проверка: BOT_MODE=webhook python bot.py, затем
+    curl -H "X-Telegram-Bot-Api-Secret-Token: $WEBHOOK_SECRET" -d @update.json localhost:8443/telegram/webhook
+"""
+import asyncio
+import hmac
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from telegram import Update
+from telegram.ext import Application
+from metrics import WEBHOOK_UPDATES
+from config import get_config
+
+log = logging.getLogger(__name__)
+
+MAX_BODY = 1 << 20  # апдейт Telegram — единицы килобайт
+
+
+class WebhookServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, application: Application, loop: asyncio.AbstractEventLoop,
+                 path: str, secret: str, queue: "asyncio.Queue[Update]"):
+        super().__init__(address, _Handler)
+        self.application = application
+        self.loop = loop
+        self.webhook_path = path
+        self.secret = secret
+        self.queue = queue
+
+    async def enqueue(self, data: dict) -> bool:
+        # выполняется в event loop бота: put_nowait не ждёт места в очереди
+        update = Update.de_json(data, self.application.bot)
+        try:
+            self.queue.put_nowait(update)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: WebhookServer
+
+    def do_POST(self):
+        if self.path != self.server.webhook_path:
+            return self._reply(404)
+        token = self.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not hmac.compare_digest(token.encode(), self.server.secret.encode()):
+            WEBHOOK_UPDATES.inc("forbidden")
+            return self._reply(403)
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0 or length > MAX_BODY:
+            return self._reply(400)
+        try:
+            data = json.loads(self.rfile.read(length))
+        except ValueError:
+            WEBHOOK_UPDATES.inc("bad_request")
+            return self._reply(400)
+        fut = asyncio.run_coroutine_threadsafe(self.server.enqueue(data), self.server.loop)
+        try:
+            accepted = fut.result(timeout=5)
+        except Exception:
+            log.exception("webhook update rejected")
+            WEBHOOK_UPDATES.inc("bad_request")
+            return self._reply(400)
+        if not accepted:
+            WEBHOOK_UPDATES.inc("queue_full")
+            return self._reply(503, {"Retry-After": "1"})
+        WEBHOOK_UPDATES.inc("accepted")
+        self._reply(200)
+
+    def _reply(self, status: int, headers: dict | None = None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, fmt, *args):
+        log.debug("webhook %s", fmt % args)
+
+
+def _parse_listen(listen: str):
+    host, _, port = listen.rpartition(":")
+    return host or "0.0.0.0", int(port)
+
+
+async def _worker(application: Application, queue: "asyncio.Queue[Update]"):
+    while True:
+        update = await queue.get()
+        try:
+            await application.process_update(update)
+        except Exception:
+            log.exception("update processing failed")
+        finally:
+            queue.task_done()
+
+
+async def serve_webhook(application: Application, stop_signals=None):
+    """
+    Запускает Application без Updater и HTTP-приёмник; при WEBHOOK_URL регистрирует вебхук
+    в Telegram. Работает до сигнала из stop_signals (None — до отмены задачи).
+    """
+    cfg = get_config()
+    if not cfg.WEBHOOK_SECRET:
+        raise RuntimeError("WEBHOOK_SECRET не задан: без него вебхук примет апдейт от кого угодно")
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in stop_signals or ():
+        loop.add_signal_handler(sig, stop.set)
+
+    queue: "asyncio.Queue[Update]" = asyncio.Queue(maxsize=cfg.WEBHOOK_QUEUE_SIZE)
+    server = WebhookServer(
+        _parse_listen(cfg.WEBHOOK_LISTEN), application, loop, cfg.WEBHOOK_PATH, cfg.WEBHOOK_SECRET, queue
+    )
+    async with application:
+        # post_init/post_stop PTB вызывает сам только в run_polling/run_webhook
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        workers = [asyncio.create_task(_worker(application, queue))
+                   for _ in range(cfg.BOT_CONCURRENT_UPDATES)]
+        if cfg.WEBHOOK_URL:
+            await application.bot.set_webhook(
+                cfg.WEBHOOK_URL.rstrip("/") + cfg.WEBHOOK_PATH,
+                secret_token=cfg.WEBHOOK_SECRET,
+                max_connections=cfg.WEBHOOK_MAX_CONNECTIONS,
+            )
+        thread = threading.Thread(target=server.serve_forever, name="webhook", daemon=True)
+        thread.start()
+        log.info("webhook listening on %s%s", cfg.WEBHOOK_LISTEN, cfg.WEBHOOK_PATH)
+        try:
+            await stop.wait()
+        finally:
+            # сначала перестаём принимать, затем дорабатываем принятое
+            await loop.run_in_executor(None, server.shutdown)
+            server.server_close()
+            await queue.join()
+            for w in workers:
+                w.cancel()
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
@@ -0,0 +1,19 @@
+# wsgi.py
+"""
+Точка входа веб-части для WSGI-сервера: gunicorn -c gunicorn.conf.py wsgi:application.
+Схему создаёт мастер (on_starting), фоновые потоки (resolver, ledger_writer) стартуют в каждом воркере
+после fork (post_fork) — см. gunicorn.conf.py; без -c gunicorn.conf.py ни то, ни другое не выполняется.
+"""
+from web import app as application
+from catalog import gift_catalog
+from resolver import resolver
+from ledger import ledger_writer
+
+
+def start_worker():
+    gift_catalog.load()
+    # всегда: пулы из /api/join_pool закрывает, разыгрывает и отменяет с возвратом только резолвер,
+    # веб-часть не должна зависеть от того, запущен ли бот. Резолверы нескольких процессов
+    # друг другу не мешают — переходы статусов условные
+    resolver.start()
+    ledger_writer.start()  # сворачивает журнал в users.stars_balance, чтобы хвост не рос без бота